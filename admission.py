@@ -0,0 +1,152 @@
+"""Admission control for the booking routes during surges.
+
+Three layers, all in-process and per worker:
+
+* a token bucket per user limits how fast one person can hit the booking pages,
+* a FIFO waiting room per trip caps concurrent bookings on the same bus and
+  tells everyone else their position and an estimated wait,
+* load shedding turns new arrivals away while the database pool is saturated.
+"""
+import itertools
+import threading
+import time
+from collections import deque
+
+TRIP_CONCURRENCY = 5       # bookings for one trip processed at the same time
+USER_RATE = 1.0            # booking requests per second per user, sustained
+USER_BURST = 5             # short bursts allowed on top of the sustained rate
+SHED_SATURATION = 0.9      # shed new arrivals above this DB pool saturation
+TICKET_TTL = 30.0          # seconds a waiting ticket survives without being polled
+POLL_INTERVAL = 3          # seconds between waiting-room refreshes
+
+
+class TokenBucket:
+    """Per-key token buckets refilled at `rate` tokens per second up to `burst`."""
+
+    def __init__(self, rate=USER_RATE, burst=USER_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def allow(self, key, now=None):
+        """Take one token for `key`; False means the caller is over its limit."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            self.buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if len(self.buckets) > 10000:
+                self._drop_full(now)
+            return allowed
+
+    def retry_after(self, key, now=None):
+        """Seconds until `key` has a token again."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        return max(0.0, (1 - tokens) / self.rate)
+
+    def _drop_full(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        full = [key for key, (tokens, updated) in self.buckets.items()
+                if tokens + (now - updated) * self.rate >= self.burst]
+        for key in full:
+            del self.buckets[key]
+
+
+class WaitingRoom:
+    """Per-trip concurrency limit with a fair FIFO queue in front of it."""
+
+    def __init__(self, concurrency=TRIP_CONCURRENCY, ticket_ttl=TICKET_TTL):
+        self.concurrency = concurrency
+        self.ticket_ttl = ticket_ttl
+        self.active = {}        # trip -> requests being served
+        self.queues = {}        # trip -> deque of waiting tickets
+        self.tickets = {}       # ticket -> {'trip', 'last_seen'}
+        self.service_time = 1.0  # moving average of seconds per admitted request
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+        self.last_sweep = 0.0
+
+    def admit(self, trip, ticket=None, shed=False, now=None):
+        """Try to admit a request for `trip`.
+
+        Returns a dict with 'admitted' True, or 'shed' True when new arrivals
+        are being turned away, or the caller's 'ticket', 'position' and 'eta'.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._sweep(now)
+            queue = self.queues.get(trip)
+            if ticket not in self.tickets or self.tickets[ticket]['trip'] != trip:
+                ticket = None
+
+            if ticket is None:
+                if shed:
+                    return {'admitted': False, 'shed': True}
+                if not queue and self.active.get(trip, 0) < self.concurrency:
+                    self.active[trip] = self.active.get(trip, 0) + 1
+                    return {'admitted': True}
+                ticket = f"{trip}:{next(self.counter)}"
+                queue = self.queues.setdefault(trip, deque())
+                queue.append(ticket)
+                self.tickets[ticket] = {'trip': trip, 'last_seen': now}
+
+            self.tickets[ticket]['last_seen'] = now
+            position = queue.index(ticket)
+            free = self.concurrency - self.active.get(trip, 0)
+            if not shed and position < free:
+                queue.remove(ticket)
+                del self.tickets[ticket]
+                self.active[trip] = self.active.get(trip, 0) + 1
+                self._forget(trip)
+                return {'admitted': True}
+            return {
+                'admitted': False,
+                'shed': False,
+                'ticket': ticket,
+                'position': position + 1,
+                'eta': round((position + 1) * self.service_time / self.concurrency, 1),
+            }
+
+    def is_waiting(self, ticket):
+        with self.lock:
+            return ticket in self.tickets
+
+    def release(self, trip, elapsed=None):
+        """Free the slot taken by an admitted request."""
+        with self.lock:
+            if self.active.get(trip, 0) > 0:
+                self.active[trip] -= 1
+            self._forget(trip)
+            if elapsed is not None:
+                self.service_time = 0.8 * self.service_time + 0.2 * elapsed
+
+    def stats(self):
+        with self.lock:
+            return {
+                'active': {trip: count for trip, count in self.active.items() if count},
+                'waiting': {trip: len(queue) for trip, queue in self.queues.items() if queue},
+                'service_time': round(self.service_time, 3),
+            }
+
+    def _sweep(self, now):
+        # Forget tickets whose holders closed the page so they stop blocking the queue
+        if now - self.last_sweep < 1.0:
+            return
+        self.last_sweep = now
+        expired = [ticket for ticket, info in self.tickets.items() if now - info['last_seen'] > self.ticket_ttl]
+        for ticket in expired:
+            trip = self.tickets.pop(ticket)['trip']
+            self.queues[trip].remove(ticket)
+            self._forget(trip)
+
+    def _forget(self, trip):
+        # Drop a trip's empty queue and idle counter so every trip ever requested is not kept forever
+        if trip in self.queues and not self.queues[trip]:
+            del self.queues[trip]
+        if self.active.get(trip) == 0:
+            del self.active[trip]
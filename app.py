@@ -1,77 +1,138 @@
-from flask import Flask, render_template, request, redirect, url_for, session
-from db_config import create_connection, close_connection
+import time
+
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, g, make_response, Response, stream_with_context
+from admission import TokenBucket, WaitingRoom, POLL_INTERVAL, SHED_SATURATION
+from booking_events import BATCH_SIZE as EVENT_BATCH_SIZE, event_json, outboxes
+from delivery import AssetManifest, add_validators, compress_response, not_modified, version_tag
+from db_config import SHARDS, create_connection, create_read_connection, close_connection, write_nodes, write_saturation
+from jobs import combine_queue_metrics, get_metrics, queue_metrics, verify_ticket_code
+from repositories import MySQLStore, Passenger, mysql_sharded_store
+from seat_events import event_stream, get_channel, held_seats, hold_seats, publish_resync, publish_seats, release_holds
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 app.secret_key = 'my_serect_key_12345'  # TODO: Use a secure secret key in production
 
+# Static files are linked under content-hashed names and cached for a year
+assets = AssetManifest(app.static_folder)
+app.jinja_env.globals['asset_url'] = lambda filename: url_for('asset', fingerprinted=assets.fingerprinted(filename))
+app.after_request(compress_response)
+
+def read_connection():
+    """Connection for read-only queries; replicas are used once they have this user's last write."""
+    return create_read_connection(session.get('last_write_at'))
+
+def mark_write():
+    """Remember when this user last committed so their next reads see it."""
+    session['last_write_at'] = time.time()
+
+def get_store():
+    """Repositories used by the routes; tests put an InMemoryStore in app.config['STORE']."""
+    store = app.config.get('STORE')
+    if store is None:
+        # Shards are read from their own nodes, without replica routing
+        store = mysql_sharded_store() if SHARDS else MySQLStore(read_connection=read_connection)
+        app.config['STORE'] = store
+    return store
+
+# Booking routes go through admission control; search and browsing never wait
+ADMISSION_ENDPOINTS = {'booking', 'process_booking'}
+rate_limiter = TokenBucket()
+waiting_room = WaitingRoom()
+
+@app.before_request
+def admission_control():
+    """Rate-limit, queue or shed booking requests before they touch the database."""
+    if request.endpoint not in ADMISSION_ENDPOINTS or session.get('user_type') == 'counter':
+        return None
+
+    trip = request.values.get('bus_no')
+    ticket = request.values.get('wait_ticket')
+    fields = [(name, values) for name, values in request.values.lists() if name != 'wait_ticket']
+    page = {'action': request.path, 'method': request.method, 'fields': fields, 'bus_no': trip, 'ticket': None}
+
+    user_key = session.get('user_id') or request.remote_addr
+    if not waiting_room.is_waiting(ticket) and not rate_limiter.allow(user_key):
+        retry_after = max(1, round(rate_limiter.retry_after(user_key)))
+        return render_template('waiting_room.html', reason='rate_limited', retry_after=retry_after, **page), \
+            429, {'Retry-After': str(retry_after)}
+
+    decision = waiting_room.admit(trip, ticket, shed=write_saturation() >= SHED_SATURATION)
+    if decision['admitted']:
+        g.admitted_trip = trip
+        g.admitted_at = time.monotonic()
+        return None
+    if decision['shed']:
+        return render_template('waiting_room.html', reason='busy', retry_after=POLL_INTERVAL, **page), \
+            503, {'Retry-After': str(POLL_INTERVAL)}
+
+    page['ticket'] = decision['ticket']
+    return render_template('waiting_room.html', reason='waiting', retry_after=POLL_INTERVAL,
+                           position=decision['position'], eta=decision['eta'], **page)
+
+@app.teardown_request
+def release_admission(exc):
+    if 'admitted_trip' in g:
+        waiting_room.release(g.admitted_trip, time.monotonic() - g.admitted_at)
+
 def get_start_locations():
-    """Fetch unique start locations from the Route table."""
-    connection = create_connection()
+    """Fetch unique start locations."""
     locations = []
-    if connection:
-        try:
-            cursor = connection.cursor()
-            cursor.execute("SELECT DISTINCT start FROM Route")
-            results = cursor.fetchall()
-            locations = [row[0] for row in results]
-        except Exception as e:
-            print(f"Error fetching start locations: {e}")
-        finally:
-            close_connection(connection)
+    try:
+        locations = get_store().routes.start_locations()
+    except Exception as e:
+        print(f"Error fetching start locations: {e}")
     return locations
 
 def get_destination_locations():
-    """Fetch unique destination locations from the Route table."""
-    connection = create_connection()
+    """Fetch unique destination locations."""
     locations = []
-    if connection:
-        try:
-            cursor = connection.cursor()
-            cursor.execute("SELECT DISTINCT destination FROM Route")
-            results = cursor.fetchall()
-            locations = [row[0] for row in results]
-        except Exception as e:
-            print(f"Error fetching destination locations: {e}")
-        finally:
-            close_connection(connection)
+    try:
+        locations = get_store().routes.destinations()
+    except Exception as e:
+        print(f"Error fetching destination locations: {e}")
     return locations
 
 def get_available_buses(from_location, to_location, travel_date):
     """Fetch available buses for the selected route."""
-    connection = create_connection()
     buses = []
-    if connection:
-        try:
-            cursor = connection.cursor()
-            query = """
-                SELECT o.company_name, s.bus_no, r.start, r.destination, s.reporting_time, s.travel_time, s.ticket_price
-                FROM Schedule s
-                JOIN Bus b ON s.bus_no = b.bus_no
-                JOIN Operator o ON b.operator_id = o.operator_id
-                JOIN Route r ON s.route_id = r.route_id
-                WHERE r.start = %s AND r.destination = %s
-                ORDER BY s.travel_time
-            """
-            cursor.execute(query, (from_location, to_location))
-            results = cursor.fetchall()
-            for row in results:
-                bus = {
-                    'operator_name': row[0],
-                    'bus_no': row[1],
-                    'start': row[2],
-                    'destination': row[3],
-                    'reporting_time': str(row[4]),
-                    'departure_time': str(row[5]),
-                    'departure_date': travel_date,
-                    'price': row[6]
-                }
-                buses.append(bus)
-        except Exception as e:
-            print(f"Error fetching available buses: {e}")
-        finally:
-            close_connection(connection)
+    try:
+        for schedule in get_store().schedules.search(from_location, to_location):
+            buses.append({
+                'operator_name': schedule.operator_name,
+                'bus_no': schedule.bus_no,
+                'start': schedule.start,
+                'destination': schedule.destination,
+                'reporting_time': str(schedule.reporting_time),
+                'departure_time': str(schedule.travel_time),
+                'departure_date': travel_date,
+                'price': schedule.ticket_price,
+                'schedule_id': schedule.schedule_id,
+                'version': schedule.version,
+                'updated_at': schedule.updated_at
+            })
+    except Exception as e:
+        print(f"Error fetching available buses: {e}")
     return buses
 
+def booking_view(booking):
+    """Template fields shared by the dashboard and my_bookings."""
+    return {
+        'booking_id': booking.booking_id,
+        'passenger_name': booking.passenger_name,
+        'passenger_phone': booking.phone,
+        'passenger_cid': booking.passenger_cid,
+        'seat_no': booking.seat_no,
+        'status': booking.status,
+        'user_type': booking.user_type,
+        'bus_no': booking.bus_no,
+        'route': f"{booking.start} - {booking.destination}",
+        'price': booking.ticket_price,
+        'booking_date': booking.booked_at.strftime('%Y-%m-%d %H:%M:%S') if booking.booked_at else 'N/A',
+        'booked_by': booking.booked_by or 'Counter',
+        'reporting_time': str(booking.reporting_time) if booking.reporting_time else 'N/A',
+        'departure_time': str(booking.travel_time) if booking.travel_time else 'N/A'
+    }
+
 @app.route('/')
 def home():
     user_type = session.get('user_type')
@@ -90,28 +151,21 @@ def login():
         phone = request.form.get('username')  # Now username is phone
         password = request.form.get('password')
 
-        connection = create_connection()
-        if connection:
-            try:
-                cursor = connection.cursor()
-                query = "SELECT user_id, name, user_type FROM UserAccount WHERE phone = %s AND password = %s"
-                cursor.execute(query, (phone, password))
-                user = cursor.fetchone()
-                if user:
-                    session['user_id'] = user[0]
-                    session['user_name'] = user[1]
-                    session['user_type'] = user[2].lower()
-                    if user[2].lower() == 'counter':
-                        return redirect(url_for('counter_dashboard'))
-                    else:
-                        return redirect(url_for('home'))
+        try:
+            user = get_store().users.authenticate(phone, password)
+            if user:
+                session['user_id'] = user.user_id
+                session['user_name'] = user.name
+                session['user_type'] = user.user_type.lower()
+                if user.user_type.lower() == 'counter':
+                    return redirect(url_for('counter_dashboard'))
                 else:
-                    # TODO: Handle invalid login
-                    pass
-            except Exception as e:
-                print(f"Error logging in: {e}")
-            finally:
-                close_connection(connection)
+                    return redirect(url_for('home'))
+            else:
+                # TODO: Handle invalid login
+                pass
+        except Exception as e:
+            print(f"Error logging in: {e}")
     return render_template('login.html')
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -123,109 +177,97 @@ def register():
         password = request.form.get('password')
         user_type = request.form.get('user_type')
 
-        connection = create_connection()
-        if connection:
-            try:
-                cursor = connection.cursor()
-                query = """
-                    INSERT INTO UserAccount (name, phone, email, password, user_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                """
-                cursor.execute(query, (name, phone, email, password, user_type))
-                connection.commit()
-                return redirect(url_for('login'))
-            except Exception as e:
-                print(f"Error registering user: {e}")
-                # TODO: Handle error (e.g., duplicate email/phone)
-            finally:
-                close_connection(connection)
+        try:
+            get_store().users.create(name, phone, email, password, user_type)
+            mark_write()
+            return redirect(url_for('login'))
+        except Exception as e:
+            print(f"Error registering user: {e}")
+            # TODO: Handle error (e.g., duplicate email/phone)
     return render_template('register.html')
 
-@app.route('/book', methods=['POST'])
+@app.route('/book', methods=['GET', 'POST'])
 def book():
-    from_location = request.form.get('from')
-    to_location = request.form.get('to')
-    travel_date = request.form.get('date')
+    from_location = request.values.get('from')
+    to_location = request.values.get('to')
+    travel_date = request.values.get('date')
 
     if not from_location or not to_location or not travel_date:
         return redirect(url_for('home'))
 
     buses = get_available_buses(from_location, to_location, travel_date)
 
-    return render_template('schedule.html',
-                         from_location=from_location,
-                         to_location=to_location,
-                         travel_date=travel_date,
-                         buses=buses)
-
-@app.route('/booking', methods=['POST'])
+    # Unchanged results for an unchanged set of schedules answer 304
+    etag = version_tag('book', from_location, to_location, travel_date,
+                       [(bus['schedule_id'], bus['version']) for bus in buses])
+    last_modified = max((bus['updated_at'] for bus in buses if bus['updated_at']), default=None)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+
+    response = make_response(render_template('schedule.html',
+                                             from_location=from_location,
+                                             to_location=to_location,
+                                             travel_date=travel_date,
+                                             buses=buses))
+    return add_validators(response, etag, last_modified)
+
+@app.route('/booking', methods=['GET', 'POST'])
 def booking():
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    bus_no = request.form.get('bus_no')
+    bus_no = request.values.get('bus_no')
 
     # Fetch bus details including number of seats
-    connection = create_connection()
-    bus = None
-    num_seats = 0
-    schedule_id = None
-    if connection:
-        try:
-            cursor = connection.cursor()
-            query = """
-                SELECT s.available_seats, o.company_name, r.start, r.destination, s.reporting_time, s.travel_time, s.ticket_price, s.schedule_id
-                FROM Schedule s
-                JOIN Bus b ON s.bus_no = b.bus_no
-                JOIN Operator o ON b.operator_id = o.operator_id
-                JOIN Route r ON s.route_id = r.route_id
-                WHERE s.bus_no = %s
-            """
-            cursor.execute(query, (bus_no,))
-            result = cursor.fetchone()
-            if result:
-                num_seats = result[0]
-                schedule_id = result[7]
-                bus = {
-                    'bus_no': bus_no,
-                    'operator_name': result[1],
-                    'start': result[2],
-                    'destination': result[3],
-                    'departure_time': str(result[5]),
-                    'departure_date': request.form.get('departure_date'),
-                    'price': result[6]
-                }
-        except Exception as e:
-            print(f"Error fetching bus details: {e}")
-        finally:
-            close_connection(connection)
+    schedule = None
+    try:
+        schedule = get_store().schedules.get_by_bus(bus_no)
+    except Exception as e:
+        print(f"Error fetching bus details: {e}")
 
-    if not bus:
+    if not schedule:
         return redirect(url_for('home'))  # Bus not found
 
+    bus = {
+        'bus_no': bus_no,
+        'schedule_id': schedule.schedule_id,
+        'operator_name': schedule.operator_name,
+        'start': schedule.start,
+        'destination': schedule.destination,
+        'departure_time': str(schedule.travel_time),
+        'departure_date': request.values.get('departure_date'),
+        'price': schedule.ticket_price
+    }
+
+    # Taken before reading seats, so the page's live updates resume from here and replay anything newer
+    bus['seat_version'] = get_channel(schedule.schedule_id).version
+
+    # Seats other passengers are holding while they enter their details
+    held = held_seats(schedule.schedule_id, exclude_holder=session['user_id'])
+
+    # Bookings bump the schedule version and holds bump the seat channel's
+    etag = version_tag('booking', schedule.schedule_id, schedule.version, get_channel(schedule.schedule_id).version,
+                       bus['departure_date'], session['user_id'])
+    cached = not_modified(etag, schedule.updated_at, private=True)
+    if cached:
+        return cached
+
     # Get already booked seats for this schedule
     booked_seats = set()
-    if schedule_id:
-        connection = create_connection()
-        if connection:
-            try:
-                cursor = connection.cursor()
-                query = "SELECT seat_no FROM Booking WHERE schedule_id = %s AND status = 'Confirmed'"
-                cursor.execute(query, (schedule_id,))
-                results = cursor.fetchall()
-                booked_seats = {row[0] for row in results}
-            except Exception as e:
-                print(f"Error fetching booked seats: {e}")
-            finally:
-                close_connection(connection)
+    try:
+        booked_seats = get_store().seats.booked(schedule.schedule_id)
+    except Exception as e:
+        print(f"Error fetching booked seats: {e}")
 
     # Generate seat data based on number of seats
     seats = []
-    for i in range(1, num_seats + 1):
-        status = 'booked' if i in booked_seats else 'available'
+    for i in range(1, schedule.available_seats + 1):
+        status = 'booked' if i in booked_seats else 'held' if i in held else 'available'
         seats.append({'number': i, 'status': status})
 
-    return render_template('booking.html', bus=bus, seats=seats)
+    response = make_response(render_template('booking.html', bus=bus, seats=seats))
+    return add_validators(response, etag, schedule.updated_at, private=True)
 
 @app.route('/confirm_booking', methods=['POST'])
 def confirm_booking():
@@ -237,39 +279,33 @@ def confirm_booking():
     travel_date = request.form.get('travel_date')
 
     # Fetch bus details again for display
-    connection = create_connection()
-    bus = None
-    if connection:
-        try:
-            cursor = connection.cursor()
-            query = """
-                SELECT o.company_name, r.start, r.destination, s.travel_time, s.ticket_price
-                FROM Schedule s
-                JOIN Bus b ON s.bus_no = b.bus_no
-                JOIN Operator o ON b.operator_id = o.operator_id
-                JOIN Route r ON s.route_id = r.route_id
-                WHERE s.bus_no = %s
-            """
-            cursor.execute(query, (bus_no,))
-            result = cursor.fetchone()
-            if result:
-                bus = {
-                    'bus_no': bus_no,
-                    'operator_name': result[0],
-                    'start': result[1],
-                    'destination': result[2],
-                    'departure_time': str(result[3]),
-                    'departure_date': travel_date,
-                    'price': result[4]
-                }
-        except Exception as e:
-            print(f"Error fetching bus details: {e}")
-        finally:
-            close_connection(connection)
+    schedule = None
+    try:
+        schedule = get_store().schedules.get_by_bus(bus_no)
+    except Exception as e:
+        print(f"Error fetching bus details: {e}")
 
-    if not bus:
+    if not schedule:
         return redirect(url_for('home'))  # Bus not found
 
+    bus = {
+        'bus_no': bus_no,
+        'operator_name': schedule.operator_name,
+        'start': schedule.start,
+        'destination': schedule.destination,
+        'departure_time': str(schedule.travel_time),
+        'departure_date': travel_date,
+        'price': schedule.ticket_price,
+        'schedule_id': schedule.schedule_id
+    }
+
+    # Hold the chosen seats while the passenger fills in their details
+    seat_nos = [int(seat) for seat in selected_seats.split(',') if seat]
+    taken = hold_seats(bus['schedule_id'], seat_nos, session.get('user_id') or request.remote_addr)
+    if taken:
+        session['message'] = f"Error: Seats {', '.join(map(str, taken))} are being booked by another passenger."
+        return redirect(url_for('home'))
+
     total_price = num_seats * bus['price']
 
     return render_template('booking_details.html',
@@ -302,24 +338,17 @@ def process_booking():
     # Get user_id from session
     user_id = session['user_id']
 
-    # Get schedule_id from Schedule table
-    connection = create_connection()
+    # Get schedule_id for the bus
     schedule_id = None
-    if connection:
-        try:
-            cursor = connection.cursor()
-            query = "SELECT schedule_id FROM Schedule WHERE bus_no = %s"
-            cursor.execute(query, (bus_no,))
-            result = cursor.fetchone()
-            if result:
-                schedule_id = result[0]
-                print(f"Debug: Found schedule_id={schedule_id}")
-            else:
-                print(f"Debug: No schedule found for bus_no={bus_no}")
-        except Exception as e:
-            print(f"Error fetching schedule_id: {e}")
-        finally:
-            close_connection(connection)
+    try:
+        schedule = get_store().schedules.get_by_bus(bus_no)
+        if schedule:
+            schedule_id = schedule.schedule_id
+            print(f"Debug: Found schedule_id={schedule_id}")
+        else:
+            print(f"Debug: No schedule found for bus_no={bus_no}")
+    except Exception as e:
+        print(f"Error fetching schedule_id: {e}")
 
     if not schedule_id:
         # Handle error: schedule not found
@@ -330,30 +359,28 @@ def process_booking():
     # Insert bookings into database
     print(f"Debug: selected_seats={selected_seats}, names={names}, cids={cids}, phones={phones}")
     seat_list = selected_seats.split(',')
-    connection = create_connection()
     booking_success = False
-    if connection:
-        try:
-            cursor = connection.cursor()
-            for i, seat in enumerate(seat_list):
-                seat_no = int(seat)
-                # Check if seat is already booked
-                cursor.execute("SELECT COUNT(*) FROM Booking WHERE schedule_id = %s AND seat_no = %s AND status = 'Confirmed'", (schedule_id, seat_no))
-                if cursor.fetchone()[0] > 0:
-                    raise Exception(f'Seat {seat_no} already booked')
-                # Update available seats
-                cursor.execute("UPDATE Schedule SET available_seats = available_seats - 1 WHERE schedule_id = %s", (schedule_id,))
-                # Insert booking
-                cursor.execute("INSERT INTO Booking (user_id, schedule_id, seat_no, seats_booked, passenger_name, passenger_cid, phone, status) VALUES (%s, %s, %s, 1, %s, %s, %s, 'Confirmed')", (user_id, schedule_id, seat_no, names[i], int(cids[i]), int(phones[i])))
-            connection.commit()
-            booking_success = True
-            print(f"Booking completed for bus {bus_no}: seats {selected_seats}")
-        except Exception as e:
-            print(f"Error saving booking: {e}")
-            connection.rollback()
-            session['message'] = f'Error saving booking: {str(e)}'
-        finally:
-            close_connection(connection)
+    try:
+        held_by_others = held_seats(schedule_id, exclude_holder=user_id)
+        passengers = []
+        for i, seat in enumerate(seat_list):
+            seat_no = int(seat)
+            if seat_no in held_by_others:
+                raise Exception(f'Seat {seat_no} is being booked by another passenger')
+            passengers.append(Passenger(seat_no, names[i], int(cids[i]), int(phones[i])))
+        # Also queues the e-ticket and confirmation job in the same transaction
+        get_store().bookings.create(user_id, schedule_id, passengers, travel_date)
+        mark_write()
+        released = release_holds(schedule_id, user_id)
+        booked = [passenger.seat_no for passenger in passengers]
+        publish_seats(schedule_id, booked, 'booked')
+        # Seats the passenger held but did not book are free again
+        publish_seats(schedule_id, set(released) - set(booked), 'available')
+        booking_success = True
+        print(f"Booking completed for bus {bus_no}: seats {selected_seats}")
+    except Exception as e:
+        print(f"Error saving booking: {e}")
+        session['message'] = f'Error saving booking: {str(e)}'
 
     if booking_success:
         session['message'] = f'Booking successful! Seats {selected_seats} for bus {bus_no} have been confirmed.'
@@ -376,7 +403,6 @@ def counter_dashboard():
     print(f"Debug: counter_dashboard called for user_id {session['user_id']}, search='{search_query}', status='{status_filter}'")
 
     # Fetch recent bookings with search and filter
-    connection = create_connection()
     bookings = []
     total_bookings = 0
     total_confirmed_bookings = 0
@@ -384,79 +410,24 @@ def counter_dashboard():
     total_revenue = 0
     available_seats = 0
 
-    if connection:
-        try:
-            cursor = connection.cursor()
-
-            # Build query for bookings
-            query = """
-                SELECT b.booking_id, b.passenger_name, b.seat_no, b.status, ua.user_type,
-                       s.bus_no, r.start, r.destination, s.ticket_price,
-                       b.booked_at, b.phone,
-                       ua.name as booked_by_name
-                FROM Booking b
-                JOIN Schedule s ON b.schedule_id = s.schedule_id
-                JOIN Route r ON s.route_id = r.route_id
-                LEFT JOIN UserAccount ua ON b.user_id = ua.user_id
-                WHERE 1=1
-            """
-            params = []
-
-            if search_query:
-                query += " AND (b.passenger_name LIKE %s OR ua.name LIKE %s OR s.bus_no LIKE %s)"
-                params.extend([f'%{search_query}%', f'%{search_query}%', f'%{search_query}%'])
-
-            if status_filter:
-                query += " AND b.status = %s"
-                params.append(status_filter)
-
-            query += " ORDER BY b.booking_id DESC LIMIT 50"
-
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-
-            for row in results:
-                bookings.append({
-                    'booking_id': row[0],
-                    'passenger_name': row[1],
-                    'passenger_phone': row[10],
-                    'seat_no': row[2],
-                    'status': row[3],
-                    'user_type': row[4],
-                    'bus_no': row[5],
-                    'route': f"{row[6]} - {row[7]}",
-                    'price': row[8],
-                    'booking_date': row[9].strftime('%Y-%m-%d %H:%M:%S') if row[9] else 'N/A',
-                    'booked_by': row[11] or 'Counter'
-                })
-
-            # Get statistics from all bookings
-            cursor.execute("SELECT COUNT(*) FROM Booking")
-            total_bookings = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM Booking WHERE status = 'Confirmed'")
-            confirmed_bookings_result = cursor.fetchone()
-            total_confirmed_bookings = confirmed_bookings_result[0] if confirmed_bookings_result else 0
-
-            cursor.execute("SELECT COUNT(*) FROM Booking WHERE status = 'Cancelled'")
-            cancelled_bookings_result = cursor.fetchone()
-            total_cancelled_bookings = cancelled_bookings_result[0] if cancelled_bookings_result else 0
-
-            cursor.execute("SELECT SUM(s.ticket_price) FROM Booking b JOIN Schedule s ON b.schedule_id = s.schedule_id WHERE b.status = 'Confirmed'")
-            revenue_result = cursor.fetchone()
-            total_revenue = revenue_result[0] if revenue_result and revenue_result[0] else 0
-
-            # Calculate available seats (simplified)
-            cursor.execute("SELECT SUM(available_seats) FROM Schedule")
-            seats_result = cursor.fetchone()
-            available_seats = seats_result[0] if seats_result[0] else 0
-
-            print(f"Debug: Stats - total: {total_bookings}, confirmed: {total_confirmed_bookings}, cancelled: {total_cancelled_bookings}, revenue: {total_revenue}")
+    try:
+        store = get_store()
+        bookings = [booking_view(booking) for booking in store.bookings.search(search_query, status_filter)]
 
-        except Exception as e:
-            print(f"Error fetching dashboard data: {e}")
-        finally:
-            close_connection(connection)
+        # Get statistics from all bookings, including archived trips
+        stats = store.bookings.stats()
+        total_bookings = stats['total_bookings']
+        total_confirmed_bookings = stats['confirmed_bookings']
+        total_cancelled_bookings = stats['cancelled_bookings']
+        total_revenue = stats['revenue']
+
+        # Calculate available seats (simplified)
+        available_seats = store.schedules.total_available_seats()
+
+        print(f"Debug: Stats - total: {total_bookings}, confirmed: {total_confirmed_bookings}, cancelled: {total_cancelled_bookings}, revenue: {total_revenue}")
+
+    except Exception as e:
+        print(f"Error fetching dashboard data: {e}")
 
     return render_template('counter_dashboard.html',
                          bookings=bookings,
@@ -505,67 +476,34 @@ def process_counter_booking():
     cids = request.form.getlist('cid[]')
 
     # Get schedule_id
-    connection = create_connection()
     schedule_id = None
-    if connection:
-        try:
-            cursor = connection.cursor()
-            query = "SELECT schedule_id FROM Schedule WHERE bus_no = %s"
-            cursor.execute(query, (bus_no,))
-            result = cursor.fetchone()
-            if result:
-                schedule_id = result[0]
-        except Exception as e:
-            print(f"Error fetching schedule_id: {e}")
-        finally:
-            close_connection(connection)
+    try:
+        schedule = get_store().schedules.get_by_bus(bus_no)
+        if schedule:
+            schedule_id = schedule.schedule_id
+    except Exception as e:
+        print(f"Error fetching schedule_id: {e}")
 
     if not schedule_id:
         session['message'] = 'Error: Schedule not found for the selected bus.'
         return redirect(url_for('book_on_behalf'))
 
     # Insert bookings into database
-    connection = create_connection()
     booking_success = False
-    if connection:
-        try:
-            cursor = connection.cursor()
-            for i in range(num_seats):
-                # Find next available seat (simplified - in real app, you'd check availability)
-                seat_no = i + 1  # This is simplified; real implementation should check available seats
-
-                # Check if seat is already booked
-                cursor.execute("""
-                    SELECT COUNT(*) FROM Booking
-                    WHERE schedule_id = %s AND seat_no = %s AND status = 'Confirmed'
-                """, (schedule_id, seat_no))
-                booked_count = cursor.fetchone()[0]
-
-                if booked_count == 0:
-                    # Update available seats
-                    cursor.execute("""
-                        UPDATE Schedule
-                        SET available_seats = available_seats - 1
-                        WHERE schedule_id = %s
-                    """, (schedule_id,))
-
-                    # Insert booking
-                    cursor.execute("""
-                        INSERT INTO Booking(user_id, schedule_id, seat_no, seats_booked,
-                                           passenger_name, passenger_cid, phone, status)
-                        VALUES(%s, %s, %s, 1, %s, %s, %s, %s)
-                    """, (session['user_id'], schedule_id, seat_no, names[i], int(cids[i]), int(phones[i])))
-                else:
-                    raise Exception(f'Seat {seat_no} already booked')
-
-            connection.commit()
-            booking_success = True
-        except Exception as e:
-            print(f"Error saving booking: {e}")
-            connection.rollback()
-            session['message'] = f'Error saving booking: {str(e)}'
-        finally:
-            close_connection(connection)
+    try:
+        passengers = []
+        for i in range(num_seats):
+            # Find next available seat (simplified - in real app, you'd check availability)
+            seat_no = i + 1  # This is simplified; real implementation should check available seats
+            passengers.append(Passenger(seat_no, names[i], int(cids[i]), int(phones[i])))
+
+        get_store().bookings.create(session['user_id'], schedule_id, passengers, travel_date)
+        mark_write()
+        publish_seats(schedule_id, [passenger.seat_no for passenger in passengers], 'booked')
+        booking_success = True
+    except Exception as e:
+        print(f"Error saving booking: {e}")
+        session['message'] = f'Error saving booking: {str(e)}'
 
     if booking_success:
         session['message'] = f'Booking successful! {num_seats} seats booked for customer {customer_name}.'
@@ -585,18 +523,15 @@ def cancel_booking(booking_id):
     if 'user_id' not in session or session.get('user_type') != 'counter':
         return redirect(url_for('home'))
 
-    connection = create_connection()
-    if connection:
-        try:
-            cursor = connection.cursor()
-            cursor.execute("UPDATE Booking SET status = 'Cancelled' WHERE booking_id = %s", (booking_id,))
-            connection.commit()
-            session['message'] = f'Booking {booking_id} has been cancelled successfully.'
-        except Exception as e:
-            print(f"Error cancelling booking: {e}")
-            session['message'] = 'Error cancelling booking.'
-        finally:
-            close_connection(connection)
+    try:
+        booking = get_store().bookings.cancel(booking_id)
+        mark_write()
+        if booking and booking.status == 'Confirmed':
+            publish_seats(booking.schedule_id, [booking.seat_no], 'available')
+        session['message'] = f'Booking {booking_id} has been cancelled successfully.'
+    except Exception as e:
+        print(f"Error cancelling booking: {e}")
+        session['message'] = 'Error cancelling booking.'
 
     return redirect(url_for('counter_dashboard'))
 
@@ -605,18 +540,15 @@ def confirm_pending_booking(booking_id):
     if 'user_id' not in session or session.get('user_type') != 'counter':
         return redirect(url_for('home'))
 
-    connection = create_connection()
-    if connection:
-        try:
-            cursor = connection.cursor()
-            cursor.execute("UPDATE Booking SET status = 'Confirmed' WHERE booking_id = %s", (booking_id,))
-            connection.commit()
-            session['message'] = f'Booking {booking_id} has been confirmed successfully.'
-        except Exception as e:
-            print(f"Error confirming booking: {e}")
-            session['message'] = 'Error confirming booking.'
-        finally:
-            close_connection(connection)
+    try:
+        booking = get_store().bookings.confirm(booking_id)
+        mark_write()
+        if booking and booking.status != 'Confirmed':
+            publish_seats(booking.schedule_id, [booking.seat_no], 'booked')
+        session['message'] = f'Booking {booking_id} has been confirmed successfully.'
+    except Exception as e:
+        print(f"Error confirming booking: {e}")
+        session['message'] = 'Error confirming booking.'
 
     return redirect(url_for('counter_dashboard'))
 
@@ -628,47 +560,14 @@ def my_bookings():
     user_id = session['user_id']
     print(f"Debug: my_bookings called for user_id {user_id}")
 
-    # Fetch user's bookings
-    connection = create_connection()
+    # Fetch user's bookings, including archived trips
     bookings = []
-    if connection:
-        try:
-            cursor = connection.cursor()
-            query = """
-                SELECT b.booking_id, b.passenger_name, b.seat_no, b.status, ua.user_type,
-                       s.bus_no, r.start, r.destination, s.ticket_price,
-                       b.booked_at, b.phone, b.passenger_cid, s.reporting_time, s.travel_time
-                FROM Booking b
-                JOIN Schedule s ON b.schedule_id = s.schedule_id
-                JOIN Route r ON s.route_id = r.route_id
-                JOIN UserAccount ua ON b.user_id = ua.user_id
-                WHERE b.user_id = %s
-                ORDER BY b.booked_at DESC
-            """
-            cursor.execute(query, (user_id,))
-            results = cursor.fetchall()
-            print(f"Debug: Found {len(results)} bookings for user {user_id}")
-
-            for row in results:
-                bookings.append({
-                    'booking_id': row[0],
-                    'passenger_name': row[1],
-                    'seat_no': row[2],
-                    'status': row[3],
-                    'user_type': row[4],
-                    'bus_no': row[5],
-                    'route': f"{row[6]} - {row[7]}",
-                    'price': row[8],
-                    'booking_date': row[9].strftime('%Y-%m-%d %H:%M:%S') if row[9] else 'N/A',
-                    'passenger_phone': row[10],
-                    'passenger_cid': row[11],
-                    'reporting_time': str(row[12]) if row[12] else 'N/A',
-                    'departure_time': str(row[13]) if row[13] else 'N/A'
-                })
-        except Exception as e:
-            print(f"Error fetching user bookings: {e}")
-        finally:
-            close_connection(connection)
+    try:
+        results = get_store().bookings.for_user(user_id)
+        print(f"Debug: Found {len(results)} bookings for user {user_id}")
+        bookings = [booking_view(booking) for booking in results]
+    except Exception as e:
+        print(f"Error fetching user bookings: {e}")
 
     return render_template('my_bookings.html', bookings=bookings)
 
@@ -682,60 +581,121 @@ def update_schedule():
         departure_time = request.form.get('departure_time')
         arrival_time = request.form.get('arrival_time')
 
-        connection = create_connection()
-        if connection:
-            try:
-                cursor = connection.cursor()
-                # Update Schedule table
-                cursor.execute("""
-                    UPDATE Schedule
-                    SET travel_time = %s, reporting_time = %s
-                    WHERE schedule_id = %s
-                """, (departure_time, arrival_time, int(schedule_id)))
-                # Update related bookings to 'Rescheduled'
-                cursor.execute("""
-                    UPDATE Booking
-                    SET status = 'Rescheduled'
-                    WHERE schedule_id = %s
-                """, (int(schedule_id),))
-                connection.commit()
-                session['message'] = 'Schedule updated successfully. All related bookings have been marked as rescheduled.'
-            except Exception as e:
-                print(f"Error updating schedule: {e}")
-                session['message'] = f'Error updating schedule: {str(e)}'
-            finally:
-                close_connection(connection)
+        try:
+            # Also marks the related bookings that are not cancelled as 'Rescheduled'
+            get_store().schedules.update_times(int(schedule_id), departure_time, arrival_time)
+            mark_write()
+            publish_resync(int(schedule_id))
+            session['message'] = 'Schedule updated successfully. Its active bookings have been marked as rescheduled.'
+        except Exception as e:
+            print(f"Error updating schedule: {e}")
+            session['message'] = f'Error updating schedule: {str(e)}'
 
         return redirect(url_for('counter_dashboard'))
 
     # GET request - show schedule update form
-    connection = create_connection()
     schedules = []
-    if connection:
-        try:
-            cursor = connection.cursor()
-            cursor.execute("""
-                SELECT s.schedule_id, s.bus_no, r.start, r.destination, s.travel_time, s.reporting_time
-                FROM Schedule s
-                JOIN Route r ON s.route_id = r.route_id
-                ORDER BY s.bus_no
-            """)
-            results = cursor.fetchall()
-            for row in results:
-                schedules.append({
-                    'schedule_id': row[0],
-                    'bus_no': row[1],
-                    'route': f"{row[2]} - {row[3]}",
-                    'departure_time': str(row[4]),
-                    'arrival_time': str(row[5])
-                })
-        except Exception as e:
-            print(f"Error fetching schedules: {e}")
-        finally:
-            close_connection(connection)
+    try:
+        for schedule in get_store().schedules.list_all():
+            schedules.append({
+                'schedule_id': schedule.schedule_id,
+                'bus_no': schedule.bus_no,
+                'route': f"{schedule.start} - {schedule.destination}",
+                'departure_time': str(schedule.travel_time),
+                'arrival_time': str(schedule.reporting_time)
+            })
+    except Exception as e:
+        print(f"Error fetching schedules: {e}")
 
     return render_template('update_schedule.html', schedules=schedules)
 
+@app.route('/assets/<path:fingerprinted>')
+def asset(fingerprinted):
+    """Static files under their content-hashed names."""
+    return assets.response(fingerprinted)
+
+@app.route('/seats/<int:schedule_id>')
+def seat_state(schedule_id):
+    """Current booked and held seats, used by the seat map to resynchronise."""
+    booked = []
+    try:
+        booked = sorted(get_store().seats.booked(schedule_id))
+    except Exception as e:
+        print(f"Error fetching booked seats: {e}")
+    held = sorted(held_seats(schedule_id, exclude_holder=session.get('user_id')))
+    return jsonify({'schedule_id': schedule_id, 'booked': booked, 'held': held})
+
+@app.route('/seats/<int:schedule_id>/events')
+def seat_events(schedule_id):
+    """Server-Sent Events stream of seat changes for one schedule.
+
+    Starts after ?after=<version> (the version the seat map was rendered
+    from); a reconnecting browser's Last-Event-ID takes precedence.
+    """
+    stream = event_stream(schedule_id, request.headers.get('Last-Event-ID') or request.args.get('after'))
+    return Response(stream_with_context(stream), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/verify_ticket')
+def verify_ticket():
+    if 'user_id' not in session or session.get('user_type') != 'counter':
+        return redirect(url_for('home'))
+
+    code = request.args.get('code', '')
+    parts = code.strip().split('-')
+    if len(parts) != 3 or not parts[1].isdigit():
+        return jsonify({'code': code, 'valid': False}), 400
+
+    result = {'code': code, 'valid': False}
+    try:
+        booking = get_store().bookings.get(int(parts[1]))
+        if booking:
+            ticket = dict(booking.as_dict(), travel_date=str(booking.travel_date) if booking.travel_date else '')
+            if verify_ticket_code(code, ticket):
+                result = {'code': code, 'valid': True, 'passenger_name': booking.passenger_name,
+                          'bus_no': booking.bus_no, 'seat_no': booking.seat_no,
+                          'travel_date': ticket['travel_date']}
+    except Exception as e:
+        print(f"Error verifying ticket: {e}")
+    return jsonify(result)
+
+@app.route('/job_metrics')
+def job_metrics():
+    if 'user_id' not in session or session.get('user_type') != 'counter':
+        return redirect(url_for('home'))
+
+    metrics = {'workers': get_metrics()}
+    # Every shard node has its own queue
+    queues = []
+    for node in write_nodes():
+        connection = create_connection(node) if SHARDS else read_connection()
+        if connection:
+            try:
+                queues.append(queue_metrics(connection))
+            except Exception as e:
+                print(f"Error fetching job metrics: {e}")
+            finally:
+                close_connection(connection)
+    if queues:
+        metrics['queue'] = combine_queue_metrics(queues)
+    return jsonify(metrics)
+
+@app.route('/booking_events')
+def booking_events():
+    """Committed booking events after the `after` cursor, for downstream systems polling over HTTP."""
+    if 'user_id' not in session or session.get('user_type') != 'counter':
+        return redirect(url_for('home'))
+
+    after = request.args.get('after', 0, type=int)
+    limit = min(request.args.get('limit', EVENT_BATCH_SIZE, type=int), 1000)
+    sources = outboxes(get_store())
+    shard = request.args.get('shard', 0, type=int)
+    if not 0 <= shard < len(sources):
+        return jsonify({'error': 'Unknown shard'}), 404
+    events = sources[shard][1].read(after, limit)
+    return jsonify({'events': [event_json(event) for event in events],
+                    'next': events[-1].event_id if events else after})
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -0,0 +1,131 @@
+"""Archive bookings for completed trips out of the hot Booking table.
+
+Run periodically (e.g. nightly from cron):
+
+    python archive.py [archive_after_days]
+
+Rows are moved in small batches, each in its own short transaction, so
+booking traffic is never blocked for long. Legacy bookings without a
+travel date stay in the hot table: schedules repeat daily, so when such a
+trip runs cannot be told from the booking. With region shards every node
+archives its own bookings.
+"""
+import sys
+import time
+from datetime import date
+
+from db_config import create_connection, close_connection, write_nodes
+
+ARCHIVE_AFTER_DAYS = 7   # keep a week of departed trips hot for refunds and queries
+BATCH_SIZE = 500
+BATCH_PAUSE = 0.05       # seconds between batches to let booking traffic through
+
+ARCHIVE_COLUMNS = """booking_id, user_id, schedule_id, seat_no, seats_booked, passenger_name,
+                     passenger_cid, phone, status, booked_at, travel_date"""
+
+
+def find_archivable_bookings(cursor, archive_after_days, batch_size):
+    """Return ids of the next batch of bookings whose trip departed long enough ago."""
+    cursor.execute("""
+        SELECT booking_id FROM Booking
+        WHERE travel_date < CURDATE() - INTERVAL %s DAY
+        ORDER BY booking_id
+        LIMIT %s
+    """, (archive_after_days, batch_size))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def archive_batch(connection, booking_ids):
+    """Copy one batch into BookingArchive, update the summary and delete it from Booking."""
+    placeholders = ', '.join(['%s'] * len(booking_ids))
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"""
+            UPDATE BookingArchiveSummary t
+            JOIN (
+                SELECT COUNT(*) AS total,
+                       COALESCE(SUM(b.status = 'Confirmed'), 0) AS confirmed,
+                       COALESCE(SUM(b.status = 'Cancelled'), 0) AS cancelled,
+                       COALESCE(SUM(CASE WHEN b.status = 'Confirmed' THEN s.ticket_price END), 0) AS revenue
+                FROM Booking b
+                JOIN Schedule s ON b.schedule_id = s.schedule_id
+                WHERE b.booking_id IN ({placeholders})
+            ) x
+            SET t.total_bookings = t.total_bookings + x.total,
+                t.confirmed_bookings = t.confirmed_bookings + x.confirmed,
+                t.cancelled_bookings = t.cancelled_bookings + x.cancelled,
+                t.revenue = t.revenue + x.revenue
+            WHERE t.summary_id = 1
+        """, booking_ids)
+        cursor.execute(f"""
+            INSERT INTO BookingArchive ({ARCHIVE_COLUMNS}, trip_date)
+            SELECT {ARCHIVE_COLUMNS}, travel_date
+            FROM Booking
+            WHERE booking_id IN ({placeholders})
+        """, booking_ids)
+        moved = cursor.rowcount
+        cursor.execute(f"DELETE FROM Booking WHERE booking_id IN ({placeholders})", booking_ids)
+        connection.commit()
+        return moved
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def ensure_archive_partition(connection, year):
+    """Split the catch-all partition so `year` gets its own partition."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'BookingArchive'
+              AND PARTITION_NAME = %s
+        """, (f'p{year}',))
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(f"""
+                ALTER TABLE BookingArchive REORGANIZE PARTITION pmax INTO (
+                    PARTITION p{year} VALUES LESS THAN ({year + 1}),
+                    PARTITION pmax VALUES LESS THAN MAXVALUE
+                )
+            """)
+            print(f"Added archive partition p{year}")
+    finally:
+        cursor.close()
+
+
+def archive_completed_bookings(archive_after_days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    """Move all bookings for completed trips into the archive, batch by batch, on every node."""
+    total = sum(archive_node(node, archive_after_days, batch_size, pause) for node in write_nodes())
+    print(f"Archived {total} bookings")
+    return total
+
+
+def archive_node(node, archive_after_days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    """Archive the completed bookings on one node; None is the primary."""
+    connection = create_connection(node)
+    total = 0
+    if connection:
+        try:
+            ensure_archive_partition(connection, date.today().year)
+            cursor = connection.cursor()
+            while True:
+                booking_ids = find_archivable_bookings(cursor, archive_after_days, batch_size)
+                connection.commit()  # release the read view between batches
+                if not booking_ids:
+                    break
+                total += archive_batch(connection, booking_ids)
+                print(f"Archived {total} bookings so far")
+                if len(booking_ids) < batch_size:
+                    break
+                time.sleep(pause)
+        except Exception as e:
+            print(f"Error archiving bookings: {e}")
+        finally:
+            close_connection(connection)
+    return total
+
+
+if __name__ == '__main__':
+    archive_completed_bookings(int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_AFTER_DAYS)
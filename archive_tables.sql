@@ -0,0 +1,57 @@
+USE DrRide_db;
+
+/* ================= Travel date on bookings =================*/
+ALTER TABLE Booking
+ADD COLUMN travel_date DATE NULL,
+ADD INDEX idx_booking_travel_date (travel_date),
+ADD INDEX idx_booking_booked_at (booked_at);
+
+
+/* ================= Archive for completed trips =================
+   Bookings whose trip has departed are moved here by archive.py.
+   Partitioned by trip year so old years can be dropped or moved whole. */
+CREATE TABLE BookingArchive (
+    booking_id INT NOT NULL,
+    user_id INT NOT NULL,
+    schedule_id INT NOT NULL,
+    seat_no INT NOT NULL,
+    seats_booked INT NOT NULL,
+    passenger_name VARCHAR(150) NOT NULL,
+    passenger_cid BIGINT UNSIGNED NOT NULL,
+    phone INT,
+    status VARCHAR(20) NOT NULL,
+    booked_at DATETIME,
+    travel_date DATE,
+    trip_date DATE NOT NULL,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (booking_id, trip_date),
+    KEY idx_archive_user (user_id),
+    KEY idx_archive_schedule (schedule_id)
+)
+PARTITION BY RANGE (YEAR(trip_date)) (
+    PARTITION p2024 VALUES LESS THAN (2025),
+    PARTITION p2025 VALUES LESS THAN (2026),
+    PARTITION p2026 VALUES LESS THAN (2027),
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+/* Running totals of archived rows so dashboard stats never scan the archive */
+CREATE TABLE BookingArchiveSummary (
+    summary_id INT PRIMARY KEY,
+    total_bookings BIGINT NOT NULL DEFAULT 0,
+    confirmed_bookings BIGINT NOT NULL DEFAULT 0,
+    cancelled_bookings BIGINT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0
+);
+INSERT INTO BookingArchiveSummary (summary_id) VALUES (1);
+
+
+/* ================= Hot + archived bookings =================*/
+CREATE OR REPLACE VIEW BookingHistory AS
+    SELECT booking_id, user_id, schedule_id, seat_no, seats_booked, passenger_name,
+           passenger_cid, phone, status, booked_at, travel_date
+    FROM Booking
+    UNION ALL
+    SELECT booking_id, user_id, schedule_id, seat_no, seats_booked, passenger_name,
+           passenger_cid, phone, status, booked_at, travel_date
+    FROM BookingArchive;
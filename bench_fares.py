@@ -0,0 +1,78 @@
+"""Benchmark a full reprice of 100k schedule-days with the fare engine.
+
+Pricing is always measured. The write-back needs a database: with MySQL
+reachable, the 100k fares are also written through write_fares (temporary
+table plus UPDATE JOIN), and the stored timetable is repriced end to end.
+Both run in a transaction that is rolled back, so stored fares are left
+unchanged.
+"""
+import sys
+import time
+
+import numpy as np
+
+from fare_engine import fare_matrix, reprice, write_fares
+
+SCHEDULES = 1000
+DAYS = 100
+BUDGET_SECONDS = 1.0
+
+
+def synthetic_timetable(n, seed=0):
+    """Random timetable shaped like the real Schedule/Bus/Route data."""
+    rng = np.random.default_rng(seed)
+    capacity = rng.choice([19.0, 28.0, 32.0], size=n)
+    return {
+        'schedule_id': np.arange(1, n + 1),
+        'distance': rng.uniform(30, 200, size=n).round(2),
+        'available_seats': np.floor(rng.uniform(0, 1, size=n) * (capacity + 1)),
+        'capacity': capacity,
+        'departure_minutes': rng.integers(5 * 60, 16 * 60, size=n).astype(np.float64),
+    }
+
+
+def bench_writes(fares):
+    """Seconds to write `fares` and to reprice the stored timetable, or None without a database."""
+    from db_config import create_connection, close_connection
+    connection = create_connection()
+    if connection is None:
+        print("Skipped write-back benchmark: MySQL is not available")
+        return None
+    try:
+        start = time.perf_counter()
+        write_fares(connection, np.arange(1, fares.size + 1), fares.ravel())
+        written = time.perf_counter() - start
+        connection.rollback()
+        print(f"Wrote {fares.size} fares in {written * 1000:.1f} ms")
+
+        start = time.perf_counter()
+        updated = reprice(connection)
+        full = time.perf_counter() - start
+        connection.rollback()
+        print(f"Repriced the stored timetable end to end ({updated} changed) in {full * 1000:.1f} ms")
+        return written, full
+    finally:
+        close_connection(connection)
+
+
+def main():
+    timetable = synthetic_timetable(SCHEDULES)
+    fare_matrix(timetable, DAYS)  # warm up
+
+    runs = 5
+    start = time.perf_counter()
+    for _ in range(runs):
+        fares = fare_matrix(timetable, DAYS)
+    elapsed = (time.perf_counter() - start) / runs
+    print(f"Priced {fares.size} schedule-days in {elapsed * 1000:.1f} ms")
+
+    writes = bench_writes(fares)
+    if writes:
+        written, full = writes
+        elapsed = max(elapsed + written, full)
+    print(f"Reprice took {elapsed * 1000:.1f} ms (budget {BUDGET_SECONDS * 1000:.0f} ms)")
+    return 0 if elapsed < BUDGET_SECONDS else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
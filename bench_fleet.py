@@ -0,0 +1,48 @@
+"""Benchmark 10k Monte-Carlo demand scenarios over a network-sized timetable with two fleet candidates."""
+import sys
+import time
+
+import numpy as np
+
+from fleet_simulator import simulate
+
+ROUTES = 44
+SCHEDULES = 300
+SCENARIOS = 10000
+BUDGET_SECONDS = 5.0
+
+
+def synthetic_network(n, routes=ROUTES, seed=0):
+    """Random network and demand shaped like the real Route/Schedule/Bus data."""
+    rng = np.random.default_rng(seed)
+    capacity = rng.choice([19.0, 28.0, 32.0], size=n)
+    route_id = np.sort(rng.integers(1, routes + 1, size=n))
+    network = {
+        'schedule_id': np.arange(1, n + 1),
+        'route_id': route_id,
+        'bus_no': np.array([f"BP-1-A{1000 + i}" for i in range(n)], dtype=object),
+        'capacity': capacity,
+        'price': rng.uniform(150, 800, size=n).round(),
+        'routes': {int(r): (f"Town {r}", f"Town {r + 1}") for r in np.unique(route_id)},
+        'buses': {f"BP-1-A{1000 + i}": capacity[i] for i in range(n)},
+    }
+    demand = {'mean': capacity * rng.uniform(0.3, 1.2, size=n), 'shape': rng.uniform(2, 20, size=n)}
+    return network, demand
+
+
+def main():
+    network, demand = synthetic_network(SCHEDULES)
+    candidates = {'current': {}, 'swap': {1: network['bus_no'][-1], SCHEDULES: network['bus_no'][0]}}
+    simulate(network, demand, candidates, scenarios=1000)  # warm up
+
+    start = time.perf_counter()
+    simulate(network, demand, candidates, scenarios=SCENARIOS)
+    elapsed = time.perf_counter() - start
+
+    print(f"Simulated {SCENARIOS} scenarios x {SCHEDULES} schedules x {len(candidates)} candidates "
+          f"in {elapsed * 1000:.1f} ms (budget {BUDGET_SECONDS * 1000:.0f} ms)")
+    return 0 if elapsed < BUDGET_SECONDS else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Benchmark row mapping and statement parsing, before and after the prepared statement cache.
+
+Mapping is always measured and fails the run unless records beat the
+dict-per-row copying they replaced. Parsing needs a database: with MySQL reachable,
+the schedule search runs as plain text on a fresh cursor (before) and as a
+cached prepared statement (after).
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from repositories import Booking, queries
+
+ROWS = 100000
+QUERIES = 2000
+
+
+def synthetic_rows(n):
+    """Result rows shaped like queries.BOOKING_GET."""
+    booked_at = datetime(2026, 10, 1, 9, 30)
+    return [(i, i % 500, i % 40, i % 19 + 1, f'Passenger {i}', 11500000000 + i, 17000000 + i, 'Confirmed',
+             booked_at, None, 'BP-2-A2001', 'Thimphu', 'Paro', Decimal('247.50'), timedelta(hours=8, minutes=30),
+             timedelta(hours=9), 'Passenger', f'Account {i % 500}')
+            for i in range(n)]
+
+
+def as_dicts(rows):
+    # How the routes used to copy rows by hand
+    return [{'booking_id': row[0], 'passenger_name': row[4], 'seat_no': row[3], 'status': row[7],
+             'bus_no': row[10], 'start': row[11], 'destination': row[12], 'ticket_price': row[13],
+             'travel_time': row[15], 'booked_at': row[8]} for row in rows]
+
+
+def timed(function, *args, runs=3):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_mapping():
+    rows = synthetic_rows(ROWS)
+    results = {
+        'dict per row': timed(as_dicts, rows),
+        'Booking(*row)': timed(lambda: [Booking(*row) for row in rows]),
+        'Booking.from_row': timed(lambda: list(map(Booking.from_row, rows))),
+    }
+    for name, elapsed in results.items():
+        print(f"Mapped {ROWS} rows with {name:<17} in {elapsed * 1000:7.1f} ms")
+    return results['dict per row'], results['Booking.from_row']
+
+
+def bench_parsing():
+    from db_config import create_connection, close_connection
+    connection = create_connection()
+    if connection is None:
+        print("Skipped statement benchmark: MySQL is not available")
+        return
+    params = ('Thimphu', 'Paro')
+    try:
+        def text():
+            for _ in range(QUERIES):
+                cursor = connection.cursor()
+                cursor.execute(queries.SCHEDULE_SEARCH.sql, params)
+                cursor.fetchall()
+                cursor.close()
+
+        def prepared():
+            for _ in range(QUERIES):
+                queries.fetch_all(connection, queries.SCHEDULE_SEARCH, params)
+
+        for name, function in (('text protocol', text), ('prepared, cached', prepared)):
+            elapsed = timed(function, runs=1)
+            print(f"Ran schedule search {QUERIES} times as {name:<16} in {elapsed * 1000:7.1f} ms "
+                  f"({elapsed / QUERIES * 1e6:.0f} us per query)")
+    finally:
+        close_connection(connection)
+
+
+def main():
+    before, after = bench_mapping()
+    bench_parsing()
+    print(f"Booking.from_row takes {after / before:.0%} of the dict-per-row time")
+    return 0 if after < before else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
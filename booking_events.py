@@ -0,0 +1,83 @@
+"""Change-data stream of booking events for downstream consumers.
+
+Every booking state change (created, cancelled, confirmed, rescheduled)
+writes a BookingEvent row in the same transaction, so an event exists only
+if its change committed; a change that leaves the status as it was writes
+none. Writers insert their events last, under a lock held until commit, so
+event ids grow in commit order and a consumer reading past its offset never
+skips an event that commits later. Rolled-back transactions leave gaps in
+the ids. Consumers such as operator manifests, finance or SMS read the
+outbox in batches after their committed offset instead of scanning Booking.
+
+Delivery is at-least-once: an offset is committed only after its batch has
+been handled, so a consumer that stops mid-batch sees that batch again and
+should treat event_id as an idempotency key. With region shards every shard
+has its own outbox and each consumer keeps one offset per shard.
+
+    python booking_events.py <consumer> [batch_size]   # follow the stream as JSON lines
+"""
+import json
+import sys
+import threading
+
+BATCH_SIZE = 100
+POLL_INTERVAL = 1.0   # seconds to wait when a consumer has caught up
+
+
+def stream(events, consumer, batch_size=BATCH_SIZE, follow=True, stop_event=None, poll_interval=POLL_INTERVAL):
+    """Yield batches of events after `consumer`'s offset.
+
+    The offset of a batch is committed when the caller asks for the next
+    one. With follow=False the stream ends once the consumer has caught up.
+    """
+    stop_event = stop_event or threading.Event()
+    offset = events.get_offset(consumer)
+    while not stop_event.is_set():
+        batch = events.read(offset, batch_size)
+        if not batch:
+            if not follow:
+                return
+            stop_event.wait(poll_interval)
+            continue
+        yield batch
+        offset = batch[-1].event_id
+        events.commit_offset(consumer, offset)
+
+
+def outboxes(store):
+    """(suffix, event repository) for every outbox in the store: one per shard when sharded."""
+    if hasattr(store, 'shards'):
+        return [(f"@{position}", shard.events) for position, shard in enumerate(store.shards)]
+    return [('', store.events)]
+
+
+def event_json(event):
+    """JSON-ready dict of an event."""
+    data = event.as_dict()
+    data['created_at'] = event.created_at.isoformat() if event.created_at else None
+    return data
+
+
+def main(consumer, batch_size=BATCH_SIZE):
+    from db_config import SHARDS, create_connection
+    from repositories import MySQLStore, mysql_sharded_store
+
+    store = mysql_sharded_store() if SHARDS else MySQLStore(read_connection=create_connection)
+    sources = outboxes(store)
+    stop_event = threading.Event()
+    try:
+        while not stop_event.is_set():
+            # Drain each outbox in turn, then wait for more
+            for suffix, events in sources:
+                for batch in stream(events, consumer + suffix, batch_size, follow=False, stop_event=stop_event):
+                    for event in batch:
+                        print(json.dumps(event_json(event)), flush=True)
+            stop_event.wait(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else BATCH_SIZE)
@@ -0,0 +1,34 @@
+USE DrRide_db;
+
+/* ================= Booking event outbox =================
+   Append-only. A row is inserted in the same transaction as every booking
+   state change (created, cancelled, confirmed, rescheduled) and read by
+   downstream consumers through booking_events.py.
+   Writers take the BookingEventLock row just before inserting their events
+   and hold it until commit, so event ids are allocated in commit order and
+   a reader never sees a higher id before a lower one. */
+CREATE TABLE BookingEvent (
+    event_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    event_type VARCHAR(30) NOT NULL,
+    booking_id INT NOT NULL,
+    schedule_id INT NOT NULL,
+    user_id INT,
+    status VARCHAR(20) NOT NULL,
+    previous_status VARCHAR(20),
+    payload JSON NOT NULL,
+    created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    KEY idx_event_booking (booking_id)
+);
+
+/* Single row locked by every transaction that writes events */
+CREATE TABLE BookingEventLock (
+    lock_id TINYINT PRIMARY KEY
+);
+INSERT INTO BookingEventLock (lock_id) VALUES (1);
+
+/* Last event each named consumer has processed */
+CREATE TABLE ConsumerOffset (
+    consumer VARCHAR(100) PRIMARY KEY,
+    last_event_id BIGINT NOT NULL DEFAULT 0,
+    updated_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
+);
@@ -1,24 +1,226 @@
-import mysql.connector
+import os
+import threading
+import time
+
 from mysql.connector import Error
+from mysql.connector.errors import PoolError
+from mysql.connector.pooling import MySQLConnectionPool
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',
+    'password': 'root@12345',
+    'database': 'DrRide_db'
+}
+
+# Read replicas as "host:port,host:port". Leave unset to send everything to the primary.
+REPLICAS = [entry.strip() for entry in os.environ.get('DRUKRIDE_REPLICAS', '').split(',') if entry.strip()]
+MAX_REPLICA_LAG = float(os.environ.get('DRUKRIDE_MAX_REPLICA_LAG', '5'))  # seconds
+LAG_CHECK_INTERVAL = 2.0   # how often each replica's lag is re-measured
+REPLICA_RETRY_AFTER = 30.0  # how long an unreachable replica is skipped
+LAG_SAFETY_MARGIN = 1.0    # Seconds_Behind_Source only has one-second resolution
+
+# Region shards as "western=host:port,central=host:port,eastern=host:port"; regions may share a node.
+# Leave unset to keep every region on the primary.
+SHARDS = dict(entry.strip().split('=', 1) for entry in os.environ.get('DRUKRIDE_SHARDS', '').split(',') if entry.strip())
+
+POOL_SIZE = int(os.environ.get('DRUKRIDE_POOL_SIZE', '10'))  # connections per database server
+POOL_WAIT = float(os.environ.get('DRUKRIDE_POOL_WAIT', '2'))  # seconds to wait for a free connection
+
+_pools = {}
+_pool_in_use = {}
+_pool_lock = threading.Lock()
+_pool_released = threading.Condition(_pool_lock)
+
+_replica_state = {}
+_replica_lock = threading.Lock()
+_next_replica = 0
+
+
+def get_pool(replica=None):
+    """Return the connection pool for the primary or a "host:port" replica, creating it on first use."""
+    key = replica or 'primary'
+    with _pool_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            config = dict(DB_CONFIG)
+            if replica:
+                host, _, port = replica.partition(':')
+                config['host'] = host
+                if port:
+                    config['port'] = int(port)
+            # Sessions are not reset on return so prepared statements stay cached on each connection
+            pool = MySQLConnectionPool(pool_name=key.replace(':', '_'), pool_size=POOL_SIZE,
+                                       pool_reset_session=False, **config)
+            _pools[key] = pool
+            _pool_in_use[pool.pool_name] = 0
+        return pool
+
 
-def create_connection():
+def borrow(pool, wait=POOL_WAIT):
+    """Take a connection from `pool`, waiting up to `wait` seconds for one to be returned when it is exhausted."""
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            return pool.get_connection()
+        except PoolError:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise
+            with _pool_released:
+                # Short slices, since a release can land between the failed get and this wait
+                _pool_released.wait(min(remaining, 0.05))
+
+
+def create_connection(replica=None, wait=POOL_WAIT, raise_exhausted=False):
+    """Borrow a connection to the primary, or to the given "host:port" replica or shard, from its pool.
+
+    Returns None on failure; with raise_exhausted the PoolError of a pool
+    that stayed full for `wait` seconds is raised instead, so callers can
+    tell a busy server from an unreachable one.
+    """
     connection = None
     try:
-        connection = mysql.connector.connect(
-            host='localhost',  
-            user='root',       
-            password='root@12345',       
-            database='DrRide_db'  
-        )
+        connection = borrow(get_pool(replica), wait)
+        with _pool_lock:
+            _pool_in_use[connection.pool_name] += 1
         if connection.is_connected():
-            print("Connected to MySQL database")
-            
+            print(f"Connected to MySQL database{' replica ' + replica if replica else ''}")
+
+    except PoolError as e:
+        if raise_exhausted:
+            raise
+        print(f"Error: '{e}'")
+        connection = None
     except Error as e:
         print(f"Error: '{e}'")
+        connection = None
     return connection
 
 def close_connection(connection):
-    """Close the database connection."""
-    if connection and connection.is_connected():
-        connection.close()
-        print("Connection closed")
+    """Return the connection to its pool."""
+    if connection is None:
+        return
+    pool_name = getattr(connection, 'pool_name', None)
+    try:
+        if pool_name and connection.in_transaction:
+            # Without a session reset, the next borrower would inherit the open transaction
+            connection.rollback()
+        if pool_name or connection.is_connected():
+            connection.close()
+            print("Connection closed")
+    except Error as e:
+        print(f"Error closing connection: '{e}'")
+    finally:
+        if pool_name:
+            with _pool_released:
+                _pool_in_use[pool_name] -= 1
+                _pool_released.notify()
+
+
+def write_nodes():
+    """Servers that take writes: every distinct shard node, or just the primary (None) when unsharded."""
+    return list(dict.fromkeys(SHARDS.values())) or [None]
+
+
+def pool_saturation(replica=None):
+    """Fraction of the pool's connections currently borrowed (0.0 - 1.0)."""
+    key = replica or 'primary'
+    with _pool_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            return 0.0
+        return _pool_in_use[pool.pool_name] / pool.pool_size
+
+
+def write_saturation():
+    """Saturation of the busiest write pool: the primary's, or the fullest shard node's."""
+    return max(pool_saturation(node) for node in write_nodes())
+
+
+def measure_replica_lag(connection):
+    """Return the replica's lag in seconds, or None if replication is not running."""
+    cursor = connection.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Error:
+            cursor.execute("SHOW SLAVE STATUS")  # MySQL < 8.0.22
+        status = cursor.fetchone()
+    finally:
+        cursor.close()
+    if not status:
+        return None
+    lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+    return float(lag) if lag is not None else None
+
+
+def replica_is_usable(state, last_write_at=None, now=None):
+    """Check a replica's last measured lag against the limit and the caller's last write."""
+    now = time.time() if now is None else now
+    if state.get('down_until', 0) > now or state.get('lag') is None:
+        return False
+    if state['lag'] > MAX_REPLICA_LAG:
+        return False
+    if last_write_at:
+        # The replica had applied everything up to (checked_at - lag) when measured.
+        return state['checked_at'] - state['lag'] - LAG_SAFETY_MARGIN >= last_write_at
+    return True
+
+
+def replica_status():
+    """Snapshot of the tracked lag and health of every replica."""
+    with _replica_lock:
+        return {replica: dict(state) for replica, state in _replica_state.items()}
+
+
+def create_read_connection(last_write_at=None):
+    """Connect for a read-only query.
+
+    Picks a healthy replica whose measured lag shows it already has the
+    caller's last write (read-your-writes), and falls back to the primary
+    when no replica qualifies or a replica is unreachable.
+    """
+    global _next_replica
+    if not REPLICAS:
+        return create_connection()
+
+    with _replica_lock:
+        offset = _next_replica
+        _next_replica = (_next_replica + 1) % len(REPLICAS)
+    candidates = REPLICAS[offset:] + REPLICAS[:offset]
+
+    for replica in candidates:
+        now = time.time()
+        with _replica_lock:
+            state = dict(_replica_state.get(replica, {}))
+        if state.get('down_until', 0) > now:
+            continue
+        stale = now - state.get('checked_at', 0) >= LAG_CHECK_INTERVAL
+        if not stale and not replica_is_usable(state, last_write_at, now):
+            continue
+
+        try:
+            connection = create_connection(replica, raise_exhausted=True)
+        except PoolError:
+            # Busy, not down: try the next replica but keep this one in rotation
+            continue
+        if not connection:
+            with _replica_lock:
+                _replica_state[replica] = {'lag': None, 'checked_at': now, 'down_until': now + REPLICA_RETRY_AFTER}
+            continue
+
+        if stale:
+            try:
+                state = {'lag': measure_replica_lag(connection), 'checked_at': time.time(), 'down_until': 0}
+            except Error as e:
+                print(f"Error checking replica {replica}: {e}")
+                state = {'lag': None, 'checked_at': now, 'down_until': now + REPLICA_RETRY_AFTER}
+            with _replica_lock:
+                _replica_state[replica] = state
+
+        if replica_is_usable(state, last_write_at):
+            return connection
+        close_connection(connection)
+
+    return create_connection()
@@ -0,0 +1,139 @@
+"""HTTP delivery: response compression, fingerprinted static assets and conditional GETs.
+
+Upcountry counters are on slow links, so large pages are compressed, static
+files are cached for a year under content-hashed names, and search results
+and seat maps answer 304 Not Modified while their schedules are unchanged.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import Response, abort, request
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # in requirements.txt; without it responses fall back to gzip
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024    # bytes; smaller bodies fit in a packet or two anyway
+COMPRESSIBLE_TYPES = {'text/html', 'text/css', 'application/json', 'application/javascript'}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5          # close to gzip's speed, noticeably smaller output
+ASSET_MAX_AGE = 365 * 24 * 3600
+HASH_LENGTH = 12
+
+
+# ---------------- Compression -----------------
+def choose_encoding(accept_encodings):
+    """Pick br or gzip from a werkzeug Accept header value, preferring br on a tie."""
+    candidates = (['br'] if brotli else []) + ['gzip']
+    best = max(candidates, key=lambda encoding: accept_encodings.quality(encoding))
+    return best if accept_encodings.quality(best) > 0 else None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compress_response(response):
+    """after_request hook: compress text bodies above COMPRESS_MIN_SIZE when the client accepts it."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES
+            or response.calculate_content_length() < COMPRESS_MIN_SIZE):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # The compressed bytes are a different representation
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# ---------------- Fingerprinted assets -----------------
+class AssetManifest:
+    """Content hashes of the files in a static folder, re-read when a file changes."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.assets = {}    # filename -> (mtime_ns, digest, data)
+        self.lock = threading.Lock()
+
+    def get(self, filename):
+        """(digest, data) for a static file, or None if there is no such file."""
+        path = safe_join(self.folder, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        mtime = os.stat(path).st_mtime_ns
+        with self.lock:
+            asset = self.assets.get(filename)
+        if asset is None or asset[0] != mtime:
+            with open(path, 'rb') as f:
+                data = f.read()
+            asset = (mtime, hashlib.sha256(data).hexdigest()[:HASH_LENGTH], data)
+            with self.lock:
+                self.assets[filename] = asset
+        return asset[1], asset[2]
+
+    def fingerprinted(self, filename):
+        """"styles.css" -> "styles.<hash>.css"; unknown files keep their name."""
+        asset = self.get(filename)
+        if asset is None:
+            return filename
+        stem, extension = os.path.splitext(filename)
+        return f"{stem}.{asset[0]}{extension}"
+
+    def response(self, fingerprinted):
+        """Serve "styles.<hash>.css"; only the current hash is marked immutable."""
+        stem, extension = os.path.splitext(fingerprinted)
+        stem, _, digest = stem.rpartition('.')
+        asset = self.get(stem + extension) if stem else None
+        if asset is None:
+            abort(404)
+        response = Response(asset[1], mimetype=mimetypes.guess_type(fingerprinted)[0] or 'application/octet-stream')
+        if digest == asset[0]:
+            response.cache_control.public = True
+            response.cache_control.max_age = ASSET_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            # A page rendered before a deploy asked for the old file; never pin this copy
+            response.cache_control.no_cache = True
+        return response
+
+
+# ---------------- Conditional GETs -----------------
+def version_tag(*parts):
+    """ETag value for a page built from the given versions and inputs."""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+
+def add_validators(response, etag, last_modified=None, private=False):
+    """Attach a weak ETag and Last-Modified; browsers keep the page but revalidate every time."""
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    return response
+
+
+def not_modified(etag, last_modified=None, private=False):
+    """A 304 response if the client's copy is still current, otherwise None."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return add_validators(Response(status=304), etag, last_modified, private)
@@ -0,0 +1,185 @@
+"""Vectorized dynamic fare engine.
+
+Fares are recomputed for the whole timetable at once from route distance,
+occupancy (available_seats vs Bus.capacity), departure time of day and days
+to departure. All rules are applied as NumPy array operations, never per row.
+"""
+import sys
+
+import numpy as np
+
+from db_config import create_connection, close_connection
+
+# Default pricing rules. Every table is a list of (threshold, value) pairs,
+# sorted by threshold, so operators can tune fares without touching code.
+FARE_RULES = {
+    # (max distance in km, rate per km) - same bands as the original CASE in schema.sql
+    'distance_bands': [(80, 4.5), (150, 4.0), (500, 3.5)],
+    # (minimum load factor, multiplier)
+    'occupancy_bands': [(0.0, 1.0), (0.5, 1.05), (0.75, 1.15), (0.9, 1.3)],
+    # (start minute, end minute, multiplier) for busy departure windows
+    'peak_windows': [(5 * 60, 8 * 60, 1.1), (16 * 60, 19 * 60, 1.1)],
+    # (minimum days to departure, multiplier) for advance purchase
+    'advance_bands': [(0, 1.0), (7, 0.95), (21, 0.9)],
+    'min_multiplier': 0.8,
+    'max_multiplier': 1.5,
+    'min_fare': 100.0,
+    'round_to': 5.0,
+}
+
+
+def _merge_rules(rules):
+    merged = dict(FARE_RULES)
+    if rules:
+        merged.update(rules)
+    return merged
+
+
+def _band_lookup(values, bands):
+    """Return the multiplier of the last band whose threshold is <= value."""
+    thresholds = np.array([band[0] for band in bands], dtype=np.float64)
+    multipliers = np.array([band[1] for band in bands], dtype=np.float64)
+    index = np.searchsorted(thresholds, values, side='right') - 1
+    return multipliers[np.clip(index, 0, len(bands) - 1)]
+
+
+def base_fares(distance, rules=None):
+    """Distance-band base fare, equivalent to the static CASE in schema.sql."""
+    rules = _merge_rules(rules)
+    bands = rules['distance_bands']
+    limits = np.array([band[0] for band in bands], dtype=np.float64)
+    rates = np.array([band[1] for band in bands], dtype=np.float64)
+    distance = np.asarray(distance, dtype=np.float64)
+    index = np.clip(np.searchsorted(limits, distance, side='left'), 0, len(bands) - 1)
+    return distance * rates[index]
+
+
+def compute_fares(distance, available_seats, capacity, departure_minutes, days_to_departure, rules=None):
+    """Compute fares for whole arrays of schedules.
+
+    All arguments are array-like and are broadcast against each other, so
+    passing per-schedule columns of shape (n, 1) and days of shape (1, d)
+    prices an n x d timetable in one call.
+    """
+    rules = _merge_rules(rules)
+    distance = np.asarray(distance, dtype=np.float64)
+    available_seats = np.asarray(available_seats, dtype=np.float64)
+    capacity = np.asarray(capacity, dtype=np.float64)
+    departure_minutes = np.asarray(departure_minutes, dtype=np.float64)
+    days_to_departure = np.asarray(days_to_departure, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        load_factor = np.where(capacity > 0, 1.0 - available_seats / capacity, 1.0)
+    load_factor = np.clip(load_factor, 0.0, 1.0)
+
+    multiplier = _band_lookup(load_factor, rules['occupancy_bands'])
+    for start, end, factor in rules['peak_windows']:
+        in_window = (departure_minutes >= start) & (departure_minutes < end)
+        multiplier = multiplier * np.where(in_window, factor, 1.0)
+    multiplier = multiplier * _band_lookup(days_to_departure, rules['advance_bands'])
+    multiplier = np.clip(multiplier, rules['min_multiplier'], rules['max_multiplier'])
+
+    fares = base_fares(distance, rules) * multiplier
+    fares = np.maximum(fares, rules['min_fare'])
+    step = rules['round_to']
+    if step:
+        fares = np.round(fares / step) * step
+    return fares
+
+
+def load_timetable(connection):
+    """Load every schedule into column arrays keyed by field name."""
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT s.schedule_id, r.distance, s.available_seats, b.capacity,
+               TIME_TO_SEC(s.travel_time) DIV 60
+        FROM Schedule s
+        JOIN Bus b ON s.bus_no = b.bus_no
+        JOIN Route r ON s.route_id = r.route_id
+    """)
+    rows = cursor.fetchall()
+    cursor.close()
+    data = np.array(rows, dtype=np.float64).reshape(-1, 5)
+    return {
+        'schedule_id': data[:, 0].astype(np.int64),
+        'distance': data[:, 1],
+        'available_seats': data[:, 2],
+        'capacity': data[:, 3],
+        'departure_minutes': data[:, 4],
+    }
+
+
+def fare_matrix(timetable, days, rules=None):
+    """Price every schedule for each of the next `days` departure days."""
+    return compute_fares(
+        timetable['distance'][:, None],
+        timetable['available_seats'][:, None],
+        timetable['capacity'][:, None],
+        timetable['departure_minutes'][:, None],
+        np.arange(days)[None, :],
+        rules,
+    )
+
+
+def write_fares(connection, schedule_ids, fares):
+    """Write changed fares back to Schedule.ticket_price with a single UPDATE; returns how many changed."""
+    cursor = connection.cursor()
+    cursor.execute("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS FareUpdate (
+            schedule_id INT PRIMARY KEY,
+            ticket_price DECIMAL(10,2) NOT NULL
+        )
+    """)
+    cursor.execute("TRUNCATE TABLE FareUpdate")
+    # executemany() folds these rows into one multi-row INSERT
+    cursor.executemany(
+        "INSERT INTO FareUpdate (schedule_id, ticket_price) VALUES (%s, %s)",
+        list(zip(np.asarray(schedule_ids).tolist(), np.asarray(fares).tolist())),
+    )
+    cursor.execute("""
+        UPDATE Schedule s
+        JOIN FareUpdate f ON s.schedule_id = f.schedule_id
+        SET s.ticket_price = f.ticket_price, s.version = s.version + 1
+        WHERE NOT (s.ticket_price <=> f.ticket_price)
+    """)
+    updated = cursor.rowcount
+    cursor.execute("DROP TEMPORARY TABLE FareUpdate")
+    cursor.close()
+    return updated
+
+
+def reprice(connection, rules=None, days_ahead=0):
+    """Load, price and write back every schedule on `connection`, leaving the commit to the caller."""
+    timetable = load_timetable(connection)
+    if not len(timetable['schedule_id']):
+        return 0
+    fares = compute_fares(
+        timetable['distance'],
+        timetable['available_seats'],
+        timetable['capacity'],
+        timetable['departure_minutes'],
+        days_ahead,
+        rules,
+    )
+    return write_fares(connection, timetable['schedule_id'], fares)
+
+
+def reprice_schedules(rules=None, days_ahead=0):
+    """Recompute and store the fare of every schedule's departure `days_ahead` days out."""
+    connection = create_connection()
+    updated = 0
+    if connection:
+        try:
+            updated = reprice(connection, rules, days_ahead)
+            connection.commit()
+            print(f"Repriced {updated} schedules")
+        except Exception as e:
+            print(f"Error repricing schedules: {e}")
+            connection.rollback()
+        finally:
+            close_connection(connection)
+    return updated
+
+
+if __name__ == '__main__':
+    reprice_schedules(days_ahead=int(sys.argv[1]) if len(sys.argv) > 1 else 0)
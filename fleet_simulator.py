@@ -0,0 +1,281 @@
+"""Monte-Carlo fleet capacity simulator.
+
+Loads the timetable, bus capacities and historical demand into NumPy arrays
+and simulates thousands of demand scenarios for one travel day across the
+whole network at once. Every candidate fleet assignment is evaluated against
+the same scenarios, so differences between candidates come from the buses
+and not from sampling noise. Reports per-route load factor, spill
+(passengers turned away because their trip was full) and revenue.
+
+    python fleet_simulator.py [--scenarios 10000] [--workers 4] [--swap BUS_A BUS_B ...]
+"""
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from db_config import create_connection, close_connection, write_nodes
+
+SCENARIOS = 10000
+CHUNK_SIZE = 1000          # scenarios per block; bounds memory at CHUNK_SIZE x schedules per array
+DAY_VOLATILITY = 0.15      # network-wide day-to-day swings (festivals, weather), lognormal sigma
+CENSORED_UPLIFT = 1.15     # sold-out days hide demand, so their bookings are scaled up by this much
+DEFAULT_LOAD_FACTOR = 0.5  # expected load of schedules without booking history
+POISSON_SHAPE = 1e6        # gamma shape when demand is not overdispersed, i.e. plain Poisson
+
+
+def load_network(connection):
+    """Load every schedule with its route, bus capacity and fare into column arrays."""
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT s.schedule_id, s.route_id, s.bus_no, b.capacity, COALESCE(s.ticket_price, 0), r.start, r.destination
+        FROM Schedule s
+        JOIN Bus b ON s.bus_no = b.bus_no
+        JOIN Route r ON s.route_id = r.route_id
+        ORDER BY s.schedule_id
+    """)
+    rows = cursor.fetchall()
+    cursor.execute("SELECT bus_no, capacity FROM Bus")
+    buses = {bus_no: float(capacity) for bus_no, capacity in cursor.fetchall()}
+    cursor.close()
+    return {
+        'schedule_id': np.array([row[0] for row in rows], dtype=np.int64),
+        'route_id': np.array([row[1] for row in rows], dtype=np.int64),
+        'bus_no': np.array([row[2] for row in rows], dtype=object),
+        'capacity': np.array([row[3] for row in rows], dtype=np.float64),
+        'price': np.array([row[4] for row in rows], dtype=np.float64),
+        'routes': {row[1]: (row[5], row[6]) for row in rows},
+        'buses': buses,
+    }
+
+
+def load_history(connection):
+    """Seats sold per schedule and travel day, from hot and archived bookings."""
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT schedule_id, COALESCE(travel_date, DATE(booked_at)) AS day, COUNT(*)
+        FROM BookingHistory
+        WHERE status <> 'Cancelled'
+        GROUP BY schedule_id, day
+    """)
+    rows = cursor.fetchall()
+    cursor.close()
+    return {
+        'schedule_id': np.array([row[0] for row in rows], dtype=np.int64),
+        'day': np.array([row[1].toordinal() for row in rows], dtype=np.int64),
+        'sold': np.array([row[2] for row in rows], dtype=np.float64),
+    }
+
+
+def merge_networks(parts):
+    """Combine (network, history) pairs loaded from each region shard; ids are unique across shards."""
+    networks, histories = zip(*parts)
+    order = np.argsort(np.concatenate([network['schedule_id'] for network in networks]), kind='stable')
+    network = {key: np.concatenate([part[key] for part in networks])[order]
+               for key in ('schedule_id', 'route_id', 'bus_no', 'capacity', 'price')}
+    network['routes'] = {key: value for part in networks for key, value in part['routes'].items()}
+    network['buses'] = {key: value for part in networks for key, value in part['buses'].items()}
+    history = {key: np.concatenate([part[key] for part in histories]) for key in ('schedule_id', 'day', 'sold')}
+    return network, history
+
+
+def estimate_demand(network, history):
+    """Per-schedule daily demand as a gamma-Poisson (negative binomial) mean and shape.
+
+    Each schedule is measured from its first booked day onwards, days without
+    bookings count as zero demand, and sold-out days are uplifted because
+    bookings cap at the bus size.
+    """
+    capacity = network['capacity']
+    mean = DEFAULT_LOAD_FACTOR * capacity
+    variance = mean.copy()
+
+    position = np.searchsorted(network['schedule_id'], history['schedule_id'])
+    known = position < len(network['schedule_id'])
+    known[known] = network['schedule_id'][position[known]] == history['schedule_id'][known]
+    if known.any():
+        position, days, sold = position[known], history['day'][known], history['sold'][known]
+        first_day = days.min()
+        matrix = np.zeros((len(capacity), days.max() - first_day + 1))
+        np.add.at(matrix, (position, days - first_day), sold)
+        matrix = np.where(matrix >= capacity[:, None], matrix * CENSORED_UPLIFT, matrix)
+
+        booked = matrix > 0
+        has_history = booked.any(axis=1)
+        observed = np.arange(matrix.shape[1]) >= booked.argmax(axis=1)[:, None]
+        count = observed.sum(axis=1)
+        rows_mean = (matrix * observed).sum(axis=1) / count
+        squares = ((matrix - rows_mean[:, None]) ** 2 * observed).sum(axis=1)
+        rows_variance = np.where(count > 1, squares / np.maximum(count - 1, 1), rows_mean)
+        mean = np.where(has_history, rows_mean, mean)
+        variance = np.where(has_history, rows_variance, variance)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shape = np.where(variance > mean, mean ** 2 / (variance - mean), POISSON_SHAPE)
+    return {'mean': mean, 'shape': np.clip(shape, 1e-3, POISSON_SHAPE)}
+
+
+def capacities(network, assignment=None):
+    """Seats per schedule once the buses in `assignment` ({schedule_id: bus_no}) replace the timetabled ones."""
+    capacity = network['capacity'].copy()
+    for schedule_id, bus_no in (assignment or {}).items():
+        index = np.searchsorted(network['schedule_id'], schedule_id)
+        if index >= len(capacity) or network['schedule_id'][index] != schedule_id:
+            raise ValueError(f"Unknown schedule {schedule_id}")
+        if bus_no not in network['buses']:
+            raise ValueError(f"Unknown bus {bus_no}")
+        capacity[index] = network['buses'][bus_no]
+    return capacity
+
+
+def swap_buses(network, bus_a, bus_b):
+    """Assignment that runs bus_a's schedules with bus_b and the other way round."""
+    assignment = {}
+    for schedule_id, bus_no in zip(network['schedule_id'].tolist(), network['bus_no']):
+        if bus_no == bus_a:
+            assignment[schedule_id] = bus_b
+        elif bus_no == bus_b:
+            assignment[schedule_id] = bus_a
+    return assignment
+
+
+def _simulate_chunk(job):
+    """Simulate one block of scenarios for every candidate; returns route-level totals per scenario."""
+    mean, shape, candidate_capacities, price, route_index, route_count, scenarios, seed = job
+    rng = np.random.default_rng(seed)
+    day = rng.lognormal(-DAY_VOLATILITY ** 2 / 2, DAY_VOLATILITY, size=(scenarios, 1))
+    demand = rng.poisson(rng.gamma(shape, mean / shape, size=(scenarios, len(mean))) * day).astype(np.float64)
+
+    by_route = np.zeros((len(mean), route_count))
+    by_route[np.arange(len(mean)), route_index] = 1.0
+    results = []
+    for capacity in candidate_capacities:
+        sold = np.minimum(demand, capacity)
+        results.append({
+            'sold': sold @ by_route,
+            'spill': (demand - sold) @ by_route,
+            'revenue': (sold * price) @ by_route,
+            'sellouts': (demand >= capacity).astype(np.float64) @ by_route,
+        })
+    return demand @ by_route, results
+
+
+def simulate(network, demand, candidates, scenarios=SCENARIOS, seed=0, workers=None):
+    """Run `scenarios` demand draws for each candidate assignment ({name: assignment}).
+
+    Scenarios are drawn in fixed blocks seeded from `seed`, so the result
+    does not depend on `workers`; with workers > 1 the blocks run on a
+    process pool.
+    """
+    names = list(candidates)
+    candidate_capacities = np.stack([capacities(network, candidates[name]) for name in names])
+    route_ids = np.unique(network['route_id'])
+    route_index = np.searchsorted(route_ids, network['route_id'])
+
+    sizes = [min(CHUNK_SIZE, scenarios - start) for start in range(0, scenarios, CHUNK_SIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(demand['mean'], demand['shape'], candidate_capacities, network['price'], route_index, len(route_ids),
+             size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_simulate_chunk, jobs))
+    else:
+        parts = [_simulate_chunk(job) for job in jobs]
+
+    route_demand = np.concatenate([part[0] for part in parts])
+    trips = np.bincount(route_index, minlength=len(route_ids))
+    report = {}
+    for number, name in enumerate(names):
+        totals = {key: np.concatenate([part[1][number][key] for part in parts])
+                  for key in ('sold', 'spill', 'revenue', 'sellouts')}
+        seats = np.bincount(route_index, weights=candidate_capacities[number], minlength=len(route_ids))
+        report[name] = _report(network, route_ids, trips, seats, route_demand, totals)
+    return report
+
+
+def _report(network, route_ids, trips, seats, route_demand, totals):
+    sold = totals['sold'].mean(axis=0)
+    spill = totals['spill'].mean(axis=0)
+    revenue = totals['revenue'].mean(axis=0)
+    spill_p95 = np.percentile(totals['spill'], 95, axis=0)
+    sellout_rate = totals['sellouts'].mean(axis=0) / trips
+    routes = []
+    for index, route_id in enumerate(route_ids.tolist()):
+        start, destination = network['routes'][route_id]
+        routes.append({
+            'route_id': route_id,
+            'start': start,
+            'destination': destination,
+            'trips': int(trips[index]),
+            'seats': float(seats[index]),
+            'demand': float(route_demand[:, index].mean()),
+            'load_factor': float(sold[index] / seats[index]) if seats[index] else 0.0,
+            'spill': float(spill[index]),
+            'spill_p95': float(spill_p95[index]),
+            'revenue': float(revenue[index]),
+            'sellout_rate': float(sellout_rate[index]),
+        })
+    total_seats = float(seats.sum())
+    return {
+        'routes': routes,
+        'totals': {
+            'seats': total_seats,
+            'sold': float(sold.sum()),
+            'load_factor': float(sold.sum() / total_seats) if total_seats else 0.0,
+            'spill': float(spill.sum()),
+            'revenue': float(revenue.sum()),
+        },
+    }
+
+
+def format_report(name, result):
+    """Plain-text table of one candidate's per-route results."""
+    lines = [f"== {name} (per travel day) ==",
+             f"{'Route':<36}{'Trips':>6}{'Seats':>7}{'Demand':>8}{'Load':>7}{'Spill':>7}{'p95':>6}"
+             f"{'Sold out':>9}{'Revenue':>11}"]
+    for route in result['routes']:
+        lines.append(f"{route['start'] + ' - ' + route['destination']:<36}{route['trips']:>6}{route['seats']:>7.0f}"
+                     f"{route['demand']:>8.1f}{route['load_factor']:>7.0%}{route['spill']:>7.1f}"
+                     f"{route['spill_p95']:>6.0f}{route['sellout_rate']:>9.0%}{route['revenue']:>11,.0f}")
+    totals = result['totals']
+    lines.append(f"Total: load {totals['load_factor']:.0%}, spill {totals['spill']:.1f}, "
+                 f"revenue Nu. {totals['revenue']:,.0f}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate fleet assignments against historical demand.')
+    parser.add_argument('--scenarios', type=int, default=SCENARIOS)
+    parser.add_argument('--workers', type=int, default=None, help='spread scenarios over a process pool')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--swap', nargs=2, action='append', default=[], metavar=('BUS_A', 'BUS_B'),
+                        help='candidate that exchanges the schedules of two buses (repeatable)')
+    args = parser.parse_args(argv)
+
+    parts = []
+    for node in write_nodes():
+        connection = create_connection(node)
+        if not connection:
+            return 1
+        try:
+            parts.append((load_network(connection), load_history(connection)))
+        except Exception as e:
+            print(f"Error loading network: {e}")
+            return 1
+        finally:
+            close_connection(connection)
+    network, history = merge_networks(parts)
+
+    candidates = {'current': {}}
+    for bus_a, bus_b in args.swap:
+        candidates[f"swap {bus_a} <-> {bus_b}"] = swap_buses(network, bus_a, bus_b)
+    report = simulate(network, estimate_demand(network, history), candidates, args.scenarios, args.seed, args.workers)
+    for name, result in report.items():
+        print(format_report(name, result))
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
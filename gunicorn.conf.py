@@ -0,0 +1,13 @@
+"""Gunicorn settings, read automatically by ``gunicorn app:app``.
+
+Seat holds and live seat channels are kept in process memory (see
+seat_events.py), so the app runs as one gevent worker. Each open seat map
+stream is a greenlet, not a thread.
+"""
+import os
+
+bind = os.environ.get('DRUKRIDE_BIND', '0.0.0.0:8000')
+workers = 1                 # do not raise: holds and seat deltas are per process
+worker_class = 'gevent'
+worker_connections = int(os.environ.get('DRUKRIDE_WORKER_CONNECTIONS', '5000'))
+timeout = 30
@@ -0,0 +1,19 @@
+USE DrRide_db;
+
+/* ================= Background job queue =================
+   Rows are inserted in the same transaction as the booking they belong to
+   and picked up by the workers in jobs.py. */
+CREATE TABLE JobQueue (
+    job_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    payload JSON NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'Queued',
+    attempts INT NOT NULL DEFAULT 0,
+    available_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    created_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    locked_by VARCHAR(100),
+    locked_at DATETIME(6),
+    finished_at DATETIME(6),
+    last_error VARCHAR(500),
+    KEY idx_job_pending (status, available_at)
+);
@@ -0,0 +1,416 @@
+"""Background jobs: e-tickets and booking confirmations off the request path.
+
+Jobs live in the JobQueue table. Routes call enqueue_job() with their own
+cursor before committing, so a job exists exactly when its booking does.
+Workers claim jobs in batches with SKIP LOCKED, retry failures with
+exponential backoff and record queue latency. With region shards every
+node has its own queue and gets its own workers.
+
+    python jobs.py [num_workers]
+"""
+import hashlib
+import hmac
+import html
+import importlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+from db_config import create_connection, close_connection, write_nodes
+
+BATCH_SIZE = 20
+POLL_INTERVAL = 1.0       # seconds a worker sleeps when the queue is empty
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 10     # seconds; doubled on every attempt
+LOCK_TIMEOUT = 300        # running jobs older than this are assumed lost and requeued
+REQUEUE_INTERVAL = 60     # seconds between each worker's sweeps for lost jobs
+
+TICKET_DIR = os.environ.get('DRUKRIDE_TICKET_DIR', 'tickets')
+TICKET_SECRET = os.environ.get('DRUKRIDE_TICKET_SECRET', '')  # required; ticket codes are signed with it
+SENDER = os.environ.get('DRUKRIDE_SENDER', '')  # "module:ClassName", empty for the local stub
+
+JOB_HANDLERS = {}
+
+_metrics = {'processed': 0, 'failed': 0, 'retried': 0, 'latency_total': 0.0, 'latency_max': 0.0}
+_metrics_lock = threading.Lock()
+
+
+def job_handler(job_type):
+    """Register a function that processes a batch of jobs of `job_type`.
+
+    The handler returns {job_id: error} for the jobs it could not finish;
+    the rest are completed. Raising fails the whole batch.
+    """
+    def register(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return register
+
+
+def enqueue_job(cursor, job_type, payload):
+    """Queue a job using the caller's cursor, inside the caller's transaction."""
+    cursor.execute(
+        "INSERT INTO JobQueue (job_type, payload) VALUES (%s, %s)",
+        (job_type, json.dumps(payload)),
+    )
+    return cursor.lastrowid
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt of a job that has failed `attempts` times."""
+    return RETRY_BASE_DELAY * (2 ** (attempts - 1))
+
+
+# ---------------- E-tickets -----------------
+def ticket_code(booking):
+    """Verifiable ticket code: the booking id plus an HMAC of the ticket's key fields."""
+    if not TICKET_SECRET:
+        raise RuntimeError('DRUKRIDE_TICKET_SECRET is not set')
+    message = '|'.join(str(booking.get(field, '')) for field in
+                       ('booking_id', 'schedule_id', 'seat_no', 'passenger_cid', 'travel_date'))
+    digest = hmac.new(TICKET_SECRET.encode(), message.encode(), hashlib.sha256).hexdigest()
+    return f"DR-{booking['booking_id']}-{digest[:12].upper()}"
+
+
+def verify_ticket_code(code, booking):
+    """Check a presented ticket code against the booking it claims to be for."""
+    return hmac.compare_digest(code.strip().upper(), ticket_code(booking).upper())
+
+
+def render_ticket(booking, code):
+    """Render a printable HTML e-ticket."""
+    rows = [
+        ('Ticket code', code),
+        ('Passenger', booking['passenger_name']),
+        ('Bus', booking['bus_no']),
+        ('Route', booking['route']),
+        ('Travel date', booking['travel_date'] or 'N/A'),
+        ('Reporting time', booking['reporting_time']),
+        ('Departure time', booking['departure_time']),
+        ('Seat', booking['seat_no']),
+        ('Fare', f"Nu. {booking['price']}"),
+    ]
+    cells = '\n'.join(f'<tr><th>{label}</th><td>{html.escape(str(value))}</td></tr>' for label, value in rows)
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="UTF-8"><title>DrukRide e-ticket {code}</title></head>
+<body>
+<h1>DrukRide e-ticket</h1>
+<table>
+{cells}
+</table>
+</body>
+</html>
+"""
+
+
+def fetch_ticket_bookings(connection, booking_ids):
+    """Load everything printed on the e-tickets for a batch of bookings."""
+    if not booking_ids:
+        return []
+    placeholders = ', '.join(['%s'] * len(booking_ids))
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        SELECT b.booking_id, b.schedule_id, b.seat_no, b.passenger_name, b.passenger_cid, b.phone,
+               b.travel_date, s.bus_no, r.start, r.destination, s.reporting_time, s.travel_time, s.ticket_price
+        FROM Booking b
+        JOIN Schedule s ON b.schedule_id = s.schedule_id
+        JOIN Route r ON s.route_id = r.route_id
+        WHERE b.booking_id IN ({placeholders})
+    """, booking_ids)
+    bookings = []
+    for row in cursor.fetchall():
+        bookings.append({
+            'booking_id': row[0],
+            'schedule_id': row[1],
+            'seat_no': row[2],
+            'passenger_name': row[3],
+            'passenger_cid': row[4],
+            'phone': row[5],
+            'travel_date': str(row[6]) if row[6] else '',
+            'bus_no': row[7],
+            'route': f"{row[8]} - {row[9]}",
+            'reporting_time': str(row[10]),
+            'departure_time': str(row[11]),
+            'price': row[12],
+        })
+    cursor.close()
+    return bookings
+
+
+# ---------------- Confirmation senders -----------------
+class LogSender:
+    """Local stub sender: appends confirmations to a JSON-lines file instead of sending SMS."""
+
+    def __init__(self, path=os.path.join(TICKET_DIR, 'outbox.jsonl')):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def send_batch(self, messages):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self.lock, open(self.path, 'a', encoding='utf-8') as outbox:
+            for message in messages:
+                outbox.write(json.dumps(message, default=str) + '\n')
+        print(f"Sent {len(messages)} confirmations")
+
+
+def get_sender():
+    """Instantiate the configured sender, e.g. DRUKRIDE_SENDER="sms_gateway:SmsSender"."""
+    if not SENDER:
+        return LogSender()
+    module_name, _, class_name = SENDER.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def write_ticket(booking):
+    """Write the booking's e-ticket and return its confirmation message."""
+    code = ticket_code(booking)
+    path = os.path.join(TICKET_DIR, f"ticket-{booking['booking_id']}.html")
+    with open(path, 'w', encoding='utf-8') as ticket:
+        ticket.write(render_ticket(booking, code))
+    return {
+        'to': booking['phone'],
+        'booking_id': booking['booking_id'],
+        'ticket_code': code,
+        'ticket_path': path,
+        'text': (f"DrukRide: {booking['passenger_name']}, seat {booking['seat_no']} on bus "
+                 f"{booking['bus_no']} ({booking['route']}) {booking['travel_date']} at "
+                 f"{booking['departure_time']} is confirmed. Ticket {code}"),
+    }
+
+
+@job_handler('booking_confirmation')
+def send_booking_confirmations(connection, jobs, sender):
+    """Write e-tickets for every booking in the batch and send one confirmation per passenger.
+
+    A job whose tickets cannot be written is left out of the send and
+    retried on its own, so the other passengers are not messaged twice.
+    """
+    booking_ids = [booking_id for job in jobs for booking_id in job['payload']['booking_ids']]
+    bookings = {booking['booking_id']: booking for booking in fetch_ticket_bookings(connection, booking_ids)}
+    os.makedirs(TICKET_DIR, exist_ok=True)
+    messages = []
+    sent = []
+    failures = {}
+    for job in jobs:
+        try:
+            messages += [write_ticket(bookings[booking_id]) for booking_id in job['payload']['booking_ids']
+                         if booking_id in bookings]
+            sent.append(job)
+        except Exception as e:
+            failures[job['job_id']] = e
+    if messages:
+        try:
+            sender.send_batch(messages)
+        except Exception as e:
+            failures.update((job['job_id'], e) for job in sent)
+    return failures
+
+
+# ---------------- Queue operations -----------------
+def claim_jobs(connection, worker_id, batch_size=BATCH_SIZE):
+    """Atomically take up to `batch_size` due jobs for this worker."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT job_id, job_type, payload, attempts FROM JobQueue
+            WHERE status = 'Queued' AND available_at <= NOW(6)
+            ORDER BY job_id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (batch_size,))
+        jobs = [{
+            'job_id': row[0],
+            'job_type': row[1],
+            'payload': json.loads(row[2]),
+            'attempts': row[3] + 1,
+        } for row in cursor.fetchall()]
+        if jobs:
+            placeholders = ', '.join(['%s'] * len(jobs))
+            cursor.execute(f"""
+                UPDATE JobQueue
+                SET status = 'Running', attempts = attempts + 1, locked_by = %s, locked_at = NOW(6)
+                WHERE job_id IN ({placeholders})
+            """, [worker_id] + [job['job_id'] for job in jobs])
+        connection.commit()
+        return jobs
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def complete_jobs(connection, jobs):
+    """Mark jobs done and record their queue latency."""
+    cursor = connection.cursor()
+    placeholders = ', '.join(['%s'] * len(jobs))
+    job_ids = [job['job_id'] for job in jobs]
+    cursor.execute(f"""
+        UPDATE JobQueue SET status = 'Done', finished_at = NOW(6), locked_by = NULL
+        WHERE job_id IN ({placeholders})
+    """, job_ids)
+    # Both timestamps come from the database clock, whatever the worker's timezone
+    cursor.execute(f"""
+        SELECT TIMESTAMPDIFF(MICROSECOND, created_at, finished_at) / 1000000
+        FROM JobQueue WHERE job_id IN ({placeholders})
+    """, job_ids)
+    latencies = [float(row[0]) for row in cursor.fetchall()]
+    connection.commit()
+    cursor.close()
+    with _metrics_lock:
+        for latency in latencies:
+            _metrics['processed'] += 1
+            _metrics['latency_total'] += latency
+            _metrics['latency_max'] = max(_metrics['latency_max'], latency)
+
+
+def fail_jobs(connection, jobs, error):
+    """Reschedule failed jobs with backoff, or give up after MAX_ATTEMPTS."""
+    cursor = connection.cursor()
+    for job in jobs:
+        if job['attempts'] >= MAX_ATTEMPTS:
+            cursor.execute("""
+                UPDATE JobQueue SET status = 'Failed', finished_at = NOW(6), locked_by = NULL, last_error = %s
+                WHERE job_id = %s
+            """, (str(error)[:500], job['job_id']))
+        else:
+            cursor.execute("""
+                UPDATE JobQueue
+                SET status = 'Queued', locked_by = NULL, last_error = %s,
+                    available_at = NOW(6) + INTERVAL %s SECOND
+                WHERE job_id = %s
+            """, (str(error)[:500], retry_delay(job['attempts']), job['job_id']))
+    connection.commit()
+    cursor.close()
+    with _metrics_lock:
+        for job in jobs:
+            _metrics['failed' if job['attempts'] >= MAX_ATTEMPTS else 'retried'] += 1
+
+
+def requeue_stale_jobs(connection):
+    """Return jobs held by crashed workers to the queue."""
+    cursor = connection.cursor()
+    cursor.execute("""
+        UPDATE JobQueue SET status = 'Queued', locked_by = NULL
+        WHERE status = 'Running' AND locked_at < NOW(6) - INTERVAL %s SECOND
+    """, (LOCK_TIMEOUT,))
+    requeued = cursor.rowcount
+    connection.commit()
+    cursor.close()
+    return requeued
+
+
+def process_jobs(connection, jobs, sender):
+    """Run claimed jobs through their handlers, one handler call per job type."""
+    by_type = {}
+    for job in jobs:
+        by_type.setdefault(job['job_type'], []).append(job)
+    for job_type, batch in by_type.items():
+        handler = JOB_HANDLERS.get(job_type)
+        try:
+            if handler is None:
+                raise Exception(f'No handler for job type {job_type}')
+            failures = handler(connection, batch, sender) or {}
+        except Exception as e:
+            print(f"Error processing {job_type} jobs: {e}")
+            connection.rollback()
+            failures = {job['job_id']: e for job in batch}
+        done = [job for job in batch if job['job_id'] not in failures]
+        if done:
+            complete_jobs(connection, done)
+        for job in batch:
+            if job['job_id'] in failures:
+                print(f"Error processing {job_type} job {job['job_id']}: {failures[job['job_id']]}")
+                fail_jobs(connection, [job], failures[job['job_id']])
+
+
+# ---------------- Metrics -----------------
+def get_metrics():
+    """In-process worker counters and queue latency."""
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    latency_total = metrics.pop('latency_total')
+    metrics['latency_avg'] = latency_total / metrics['processed'] if metrics['processed'] else 0.0
+    return metrics
+
+
+def queue_metrics(connection):
+    """Queue depth per status and the age of the oldest waiting job."""
+    cursor = connection.cursor()
+    cursor.execute("SELECT status, COUNT(*) FROM JobQueue GROUP BY status")
+    depth = {status: count for status, count in cursor.fetchall()}
+    cursor.execute("""
+        SELECT TIMESTAMPDIFF(MICROSECOND, MIN(created_at), NOW(6)) / 1000000
+        FROM JobQueue WHERE status = 'Queued'
+    """)
+    oldest = cursor.fetchone()[0]
+    cursor.close()
+    return {'depth': depth, 'oldest_queued_seconds': float(oldest) if oldest is not None else 0.0}
+
+
+def combine_queue_metrics(results):
+    """Sum queue_metrics() from several shard nodes."""
+    depth = {}
+    for result in results:
+        for status, count in result['depth'].items():
+            depth[status] = depth.get(status, 0) + count
+    return {'depth': depth, 'oldest_queued_seconds': max(result['oldest_queued_seconds'] for result in results)}
+
+
+# ---------------- Workers -----------------
+def worker_loop(worker_id, stop_event, batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL, node=None):
+    """Claim and process batches from the queue on `node` (the primary by default) until `stop_event` is set."""
+    sender = get_sender()
+    connection = None
+    next_requeue = 0.0
+    while not stop_event.is_set():
+        try:
+            if connection is None or not connection.is_connected():
+                connection = create_connection(node)
+                if connection is None:
+                    stop_event.wait(poll_interval)
+                    continue
+            if time.monotonic() >= next_requeue:
+                # Jobs of workers that died since the last sweep go back to the queue
+                requeued = requeue_stale_jobs(connection)
+                if requeued:
+                    print(f"Requeued {requeued} stale jobs")
+                next_requeue = time.monotonic() + REQUEUE_INTERVAL
+            jobs = claim_jobs(connection, worker_id, batch_size)
+            if not jobs:
+                stop_event.wait(poll_interval)
+                continue
+            process_jobs(connection, jobs, sender)
+        except Exception as e:
+            print(f"Worker {worker_id} error: {e}")
+            stop_event.wait(poll_interval)
+    close_connection(connection)
+
+
+def run_workers(num_workers=4, stop_event=None):
+    """Start `num_workers` worker threads per queue and block until `stop_event` is set."""
+    if not TICKET_SECRET:
+        sys.exit('DRUKRIDE_TICKET_SECRET must be set to sign e-tickets')
+    stop_event = stop_event or threading.Event()
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    threads = [threading.Thread(target=worker_loop, args=(f"{prefix}-{i}", stop_event),
+                                kwargs={'node': node}, daemon=True)
+               for node in write_nodes() for i in range(num_workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        while not stop_event.is_set():
+            stop_event.wait(60)
+            print(f"Job metrics: {get_metrics()}")
+    except KeyboardInterrupt:
+        stop_event.set()
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == '__main__':
+    run_workers(int(sys.argv[1]) if len(sys.argv) > 1 else 4)
@@ -0,0 +1,12 @@
+"""Data-access layer: typed records, interchangeable MySQL / in-memory backends and region sharding."""
+from repositories.errors import DatabaseUnavailableError, DuplicateError, RepositoryError, SeatUnavailableError
+from repositories.memory_backend import InMemoryStore
+from repositories.mysql_backend import MySQLStore
+from repositories.records import Booking, Passenger, Route, Schedule, User
+from repositories.sharding import REGIONS, ShardRouter, ShardedStore, configured_router, mysql_sharded_store
+
+__all__ = [
+    'Booking', 'DatabaseUnavailableError', 'DuplicateError', 'InMemoryStore', 'MySQLStore', 'Passenger', 'REGIONS',
+    'RepositoryError', 'Route', 'Schedule', 'SeatUnavailableError', 'ShardRouter', 'ShardedStore', 'User',
+    'configured_router', 'mysql_sharded_store',
+]
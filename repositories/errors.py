@@ -0,0 +1,14 @@
+class RepositoryError(Exception):
+    """Base class for data-access errors raised by every backend."""
+
+
+class DatabaseUnavailableError(RepositoryError):
+    """No connection to the database could be obtained."""
+
+
+class DuplicateError(RepositoryError):
+    """A row violates a uniqueness rule (phone, email, passenger CID, ...)."""
+
+
+class SeatUnavailableError(RepositoryError):
+    """A seat is already taken on the schedule."""
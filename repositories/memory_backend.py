@@ -0,0 +1,331 @@
+"""In-memory implementation of the repositories, with the same semantics as MySQL.
+
+Used by the test suite so route tests run without a database. Uniqueness
+rules mirror the schema: one Booking row per (schedule, seat), unique
+passenger CIDs, and unique phone, email and password on accounts.
+"""
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from repositories.errors import DuplicateError, SeatUnavailableError
+from repositories.records import STATUS_EVENTS, Booking, BookingEvent, Route, Schedule, User, created_payload
+
+
+def to_time(value):
+    """Store times as timedelta, which is what MySQL returns for TIME columns."""
+    if isinstance(value, timedelta):
+        return value
+    hours, minutes, *seconds = (int(part) for part in str(value).split(':'))
+    return timedelta(hours=hours, minutes=minutes, seconds=seconds[0] if seconds else 0)
+
+
+class InMemoryRepository:
+
+    def __init__(self, store):
+        self.store = store
+
+
+class InMemoryRouteRepository(InMemoryRepository):
+
+    def start_locations(self):
+        return list(dict.fromkeys(route.start for route in self.store.route_rows.values()))
+
+    def destinations(self):
+        return list(dict.fromkeys(route.destination for route in self.store.route_rows.values()))
+
+    def get(self, route_id):
+        return self.store.route_rows.get(route_id)
+
+    def add(self, start, destination, distance):
+        with self.store.lock:
+            route_id = self.store.next_id('route')
+            self.store.route_rows[route_id] = Route(route_id, start, destination, Decimal(str(distance)))
+            return route_id
+
+
+class InMemoryScheduleRepository(InMemoryRepository):
+
+    def _joined(self, row):
+        operator_name, capacity = self.store.bus_rows[row['bus_no']]
+        route = self.store.route_rows[row['route_id']]
+        return Schedule(row['schedule_id'], row['bus_no'], row['route_id'], operator_name, route.start,
+                        route.destination, row['reporting_time'], row['travel_time'], row['available_seats'],
+                        capacity, row['ticket_price'], row['version'], row['updated_at'])
+
+    def search(self, start, destination):
+        with self.store.lock:
+            schedules = [self._joined(row) for row in self.store.schedule_rows.values()
+                         if self.store.route_rows[row['route_id']].start == start
+                         and self.store.route_rows[row['route_id']].destination == destination]
+        return sorted(schedules, key=lambda schedule: schedule.travel_time)
+
+    def get(self, schedule_id):
+        with self.store.lock:
+            row = self.store.schedule_rows.get(schedule_id)
+            return self._joined(row) if row else None
+
+    def get_by_bus(self, bus_no):
+        with self.store.lock:
+            for row in self.store.schedule_rows.values():
+                if row['bus_no'] == bus_no:
+                    return self._joined(row)
+        return None
+
+    def list_all(self):
+        with self.store.lock:
+            schedules = [self._joined(row) for row in self.store.schedule_rows.values()]
+        return sorted(schedules, key=lambda schedule: schedule.bus_no)
+
+    def total_available_seats(self):
+        with self.store.lock:
+            return sum(row['available_seats'] for row in self.store.schedule_rows.values())
+
+    def update_times(self, schedule_id, travel_time, reporting_time):
+        with self.store.lock:
+            row = self.store.schedule_rows.get(schedule_id)
+            if row:
+                row['travel_time'] = to_time(travel_time)
+                row['reporting_time'] = to_time(reporting_time)
+                self.store.touch_schedule(schedule_id)
+            for booking_id, booking in self.store.booking_rows.items():
+                if booking.schedule_id == schedule_id and booking.status != 'Cancelled':
+                    self.store.booking_rows[booking_id] = booking.replace(status='Rescheduled')
+                    self.store.add_event('BookingRescheduled', booking, 'Rescheduled', booking.status, {
+                        'seat_no': booking.seat_no, 'travel_time': str(travel_time),
+                        'reporting_time': str(reporting_time)})
+
+    def add_bus(self, bus_no, operator_name, capacity):
+        with self.store.lock:
+            if bus_no in self.store.bus_rows:
+                raise DuplicateError(f"Duplicate bus {bus_no}")
+            self.store.bus_rows[bus_no] = (operator_name, capacity)
+
+    def add(self, bus_no, route_id, reporting_time, travel_time, available_seats, ticket_price):
+        with self.store.lock:
+            schedule_id = self.store.next_id('schedule')
+            self.store.schedule_rows[schedule_id] = {
+                'schedule_id': schedule_id,
+                'bus_no': bus_no,
+                'route_id': route_id,
+                'reporting_time': to_time(reporting_time),
+                'travel_time': to_time(travel_time),
+                'available_seats': available_seats,
+                'ticket_price': Decimal(str(ticket_price)),
+                'version': 0,
+                'updated_at': datetime.now(),
+            }
+            return schedule_id
+
+
+class InMemorySeatRepository(InMemoryRepository):
+
+    def booked(self, schedule_id):
+        with self.store.lock:
+            return {booking.seat_no for booking in self.store.booking_rows.values()
+                    if booking.schedule_id == schedule_id and booking.status == 'Confirmed'}
+
+
+class InMemoryUserRepository(InMemoryRepository):
+
+    def create(self, name, phone, email, password, user_type, user_id=None):
+        """Create an account; `user_id` is given when copying an account created on another shard."""
+        with self.store.lock:
+            for user, user_password in self.store.user_rows.values():
+                if user.phone == phone or user.email == email or user_password == password:
+                    raise DuplicateError('Duplicate phone, email or password')
+            if user_id in self.store.user_rows:
+                raise DuplicateError(f'Duplicate user {user_id}')
+            user_id = user_id or self.store.next_id('user')
+            self.store.user_rows[user_id] = (User(user_id, name, phone, email, user_type), password)
+            return user_id
+
+    def authenticate(self, phone, password):
+        with self.store.lock:
+            for user, user_password in self.store.user_rows.values():
+                if user.phone == phone and user_password == password:
+                    return user
+        return None
+
+    def get(self, user_id):
+        with self.store.lock:
+            row = self.store.user_rows.get(user_id)
+            return row[0] if row else None
+
+    def delete(self, user_id):
+        with self.store.lock:
+            self.store.user_rows.pop(user_id, None)
+
+
+class InMemoryBookingRepository(InMemoryRepository):
+
+    def _joined(self, booking):
+        schedule = self.store.schedule_rows[booking.schedule_id]
+        route = self.store.route_rows[schedule['route_id']]
+        user_row = self.store.user_rows.get(booking.user_id)
+        user = user_row[0] if user_row else None
+        return booking.replace(
+            bus_no=schedule['bus_no'], start=route.start, destination=route.destination,
+            ticket_price=schedule['ticket_price'], reporting_time=schedule['reporting_time'],
+            travel_time=schedule['travel_time'],
+            user_type=user.user_type if user else None, booked_by=user.name if user else None)
+
+    def create(self, user_id, schedule_id, passengers, travel_date=None):
+        with self.store.lock:
+            taken = {(booking.schedule_id, booking.seat_no) for booking in self.store.booking_rows.values()}
+            cids = {booking.passenger_cid for booking in self.store.booking_rows.values()}
+            for passenger in passengers:
+                if (schedule_id, passenger.seat_no) in taken:
+                    raise SeatUnavailableError(f'Seat {passenger.seat_no} already booked')
+                if passenger.cid in cids:
+                    raise DuplicateError(f'Duplicate passenger CID {passenger.cid}')
+                taken.add((schedule_id, passenger.seat_no))
+                cids.add(passenger.cid)
+
+            booking_ids = []
+            for passenger in passengers:
+                booking_id = self.store.next_id('booking')
+                booking = self.store.booking_rows[booking_id] = Booking(
+                    booking_id, user_id, schedule_id, passenger.seat_no, passenger.name, passenger.cid,
+                    passenger.phone, 'Confirmed', datetime.now(), travel_date or None)
+                self.store.add_event('BookingCreated', booking, 'Confirmed', None,
+                                     created_payload(passenger, travel_date))
+                self.store.schedule_rows[schedule_id]['available_seats'] -= 1
+                self.store.touch_schedule(schedule_id)
+                booking_ids.append(booking_id)
+            if booking_ids:
+                self.store.jobs.append(('booking_confirmation', {'booking_ids': booking_ids}))
+            return booking_ids
+
+    def cids_taken(self, cids):
+        with self.store.lock:
+            existing = {booking.passenger_cid for booking in self.store.booking_rows.values()}
+        return [cid for cid in cids if cid in existing]
+
+    @contextmanager
+    def lock_cids(self, cids):
+        with self.store.cid_lock:
+            yield
+
+    def get(self, booking_id):
+        with self.store.lock:
+            booking = self.store.booking_rows.get(booking_id)
+            return self._joined(booking) if booking else None
+
+    def _set_status(self, booking_id, status):
+        with self.store.lock:
+            booking = self.store.booking_rows.get(booking_id)
+            if booking is None:
+                return None
+            if booking.status == status:
+                return self._joined(booking)
+            self.store.booking_rows[booking_id] = booking.replace(status=status)
+            self.store.add_event(STATUS_EVENTS[status], booking, status, booking.status, {'seat_no': booking.seat_no})
+            self.store.touch_schedule(booking.schedule_id)
+            return self._joined(booking)
+
+    def cancel(self, booking_id):
+        return self._set_status(booking_id, 'Cancelled')
+
+    def confirm(self, booking_id):
+        return self._set_status(booking_id, 'Confirmed')
+
+    def for_user(self, user_id):
+        with self.store.lock:
+            bookings = [self._joined(booking) for booking in self.store.history()
+                        if booking.user_id == user_id]
+        return sorted(bookings, key=lambda booking: booking.booked_at, reverse=True)
+
+    def search(self, search_query='', status='', limit=50):
+        needle = search_query.lower()
+        with self.store.lock:
+            source = self.store.history() if search_query else list(self.store.booking_rows.values())
+            bookings = [self._joined(booking) for booking in source]
+        if search_query:
+            bookings = [booking for booking in bookings
+                        if needle in booking.passenger_name.lower()
+                        or needle in (booking.booked_by or '').lower()
+                        or needle in booking.bus_no.lower()]
+        if status:
+            bookings = [booking for booking in bookings if booking.status == status]
+        return sorted(bookings, key=lambda booking: booking.booking_id, reverse=True)[:limit]
+
+    def stats(self):
+        with self.store.lock:
+            bookings = [self._joined(booking) for booking in self.store.booking_rows.values()]
+            archived = dict(self.store.archive_summary)
+        confirmed = [booking for booking in bookings if booking.status == 'Confirmed']
+        return {
+            'total_bookings': len(bookings) + archived['total_bookings'],
+            'confirmed_bookings': len(confirmed) + archived['confirmed_bookings'],
+            'cancelled_bookings': sum(booking.status == 'Cancelled' for booking in bookings)
+                                  + archived['cancelled_bookings'],
+            'revenue': sum((booking.ticket_price for booking in confirmed), Decimal('0')) + archived['revenue'],
+        }
+
+
+class InMemoryEventRepository(InMemoryRepository):
+
+    def read(self, after_event_id=0, limit=100):
+        with self.store.lock:
+            return [event for event in self.store.event_rows if event.event_id > after_event_id][:limit]
+
+    def get_offset(self, consumer):
+        with self.store.lock:
+            return self.store.consumer_offsets.get(consumer, 0)
+
+    def commit_offset(self, consumer, event_id):
+        with self.store.lock:
+            self.store.consumer_offsets[consumer] = max(self.store.consumer_offsets.get(consumer, 0), event_id)
+
+
+class InMemoryStore:
+    """All repositories backed by Python dicts, guarded by one lock.
+
+    `id_offset` and `id_increment` behave like MySQL's auto_increment_offset
+    and auto_increment_increment, so several stores can stand in for shards.
+    """
+
+    def __init__(self, id_offset=1, id_increment=1):
+        self.lock = threading.RLock()
+        self.cid_lock = threading.Lock()   # stand-in for PassengerCidLock
+        self.id_offset = id_offset
+        self.id_increment = id_increment
+        self.ids = {}
+        self.route_rows = {}
+        self.bus_rows = {}          # bus_no -> (operator_name, capacity)
+        self.schedule_rows = {}
+        self.user_rows = {}         # user_id -> (User, password)
+        self.booking_rows = {}
+        self.archived_rows = []     # stand-in for BookingArchive
+        self.archive_summary = {'total_bookings': 0, 'confirmed_bookings': 0,
+                                'cancelled_bookings': 0, 'revenue': Decimal('0')}
+        self.jobs = []              # stand-in for JobQueue
+        self.event_rows = []        # stand-in for BookingEvent, in event_id order
+        self.consumer_offsets = {}
+        self.routes = InMemoryRouteRepository(self)
+        self.schedules = InMemoryScheduleRepository(self)
+        self.seats = InMemorySeatRepository(self)
+        self.users = InMemoryUserRepository(self)
+        self.bookings = InMemoryBookingRepository(self)
+        self.events = InMemoryEventRepository(self)
+
+    def next_id(self, table):
+        self.ids[table] = self.ids.get(table, self.id_offset - self.id_increment) + self.id_increment
+        return self.ids[table]
+
+    def add_event(self, event_type, booking, status, previous_status, payload):
+        """Append to the outbox; callers hold the lock, like the MySQL transaction."""
+        self.event_rows.append(BookingEvent(self.next_id('event'), event_type, booking.booking_id, booking.schedule_id,
+                                            booking.user_id, status, previous_status, payload, datetime.now()))
+
+    def touch_schedule(self, schedule_id):
+        """Bump the schedule's version, like the UPDATEs in the MySQL backend."""
+        row = self.schedule_rows[schedule_id]
+        row['version'] += 1
+        row['updated_at'] = datetime.now()
+
+    def history(self):
+        """Hot and archived bookings, like the BookingHistory view."""
+        return list(self.booking_rows.values()) + self.archived_rows
@@ -0,0 +1,289 @@
+"""MySQL implementation of the repositories.
+
+Statements come from `repositories.queries` and run as prepared statements
+cached on each pooled connection.
+"""
+import json
+from contextlib import contextmanager
+
+from mysql.connector import errorcode
+from mysql.connector.errors import IntegrityError
+
+from db_config import create_connection, create_read_connection, close_connection
+from jobs import enqueue_job
+from repositories import queries
+from repositories.errors import DatabaseUnavailableError, DuplicateError, SeatUnavailableError
+from repositories.records import STATUS_EVENTS, created_payload
+
+
+class MySQLRepository:
+    """Shared connection handling: reads may go to replicas, writes go to the primary."""
+
+    def __init__(self, store):
+        self.store = store
+
+    @contextmanager
+    def _connection(self, read=False):
+        connection = self.store.read_connection() if read else self.store.connect()
+        if not connection:
+            raise DatabaseUnavailableError('Could not connect to the database')
+        try:
+            yield connection
+        finally:
+            close_connection(connection)
+
+    @contextmanager
+    def _transaction(self):
+        connection = self.store.connect()
+        if not connection:
+            raise DatabaseUnavailableError('Could not connect to the database')
+        try:
+            yield connection
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            close_connection(connection)
+
+    def _fetch_all(self, query, params=()):
+        with self._connection(read=True) as connection:
+            return queries.fetch_all(connection, query, params)
+
+    def _fetch_one(self, query, params=()):
+        with self._connection(read=True) as connection:
+            return queries.fetch_one(connection, query, params)
+
+
+class MySQLRouteRepository(MySQLRepository):
+
+    def start_locations(self):
+        return [row[0] for row in self._fetch_all(queries.ROUTE_STARTS)]
+
+    def destinations(self):
+        return [row[0] for row in self._fetch_all(queries.ROUTE_DESTINATIONS)]
+
+    def get(self, route_id):
+        return self._fetch_one(queries.ROUTE_GET, (route_id,))
+
+    def add(self, start, destination, distance):
+        with self._transaction() as connection:
+            return queries.execute(connection, queries.ROUTE_ADD, (start, destination, distance)).lastrowid
+
+
+class MySQLScheduleRepository(MySQLRepository):
+
+    def search(self, start, destination):
+        return self._fetch_all(queries.SCHEDULE_SEARCH, (start, destination))
+
+    def get(self, schedule_id):
+        return self._fetch_one(queries.SCHEDULE_GET, (schedule_id,))
+
+    def get_by_bus(self, bus_no):
+        return self._fetch_one(queries.SCHEDULE_BY_BUS, (bus_no,))
+
+    def list_all(self):
+        return self._fetch_all(queries.SCHEDULE_LIST)
+
+    def total_available_seats(self):
+        return self._fetch_one(queries.SCHEDULE_TOTAL_SEATS)[0] or 0
+
+    def update_times(self, schedule_id, travel_time, reporting_time):
+        """Move a schedule and mark its bookings that are not cancelled as rescheduled."""
+        with self._transaction() as connection:
+            queries.execute(connection, queries.SCHEDULE_UPDATE_TIMES, (travel_time, reporting_time, schedule_id))
+            # Lock the bookings before the event lock, so nothing else is waited on while holding it
+            queries.fetch_all(connection, queries.BOOKING_LOCK_SCHEDULE, (schedule_id,))
+            queries.fetch_one(connection, queries.EVENT_LOCK)
+            # Events first, while the bookings still have their previous status
+            queries.execute(connection, queries.EVENT_RESCHEDULE, (str(travel_time), str(reporting_time), schedule_id))
+            queries.execute(connection, queries.BOOKING_RESCHEDULE, (schedule_id,))
+
+    def add_bus(self, bus_no, operator_name, capacity):
+        with self._transaction() as connection:
+            operator_id = queries.execute(connection, queries.OPERATOR_ADD, (operator_name,)).lastrowid
+            queries.execute(connection, queries.BUS_ADD, (bus_no, operator_id, capacity))
+
+    def add(self, bus_no, route_id, reporting_time, travel_time, available_seats, ticket_price):
+        with self._transaction() as connection:
+            return queries.execute(connection, queries.SCHEDULE_ADD, (
+                bus_no, route_id, reporting_time, travel_time, available_seats, ticket_price)).lastrowid
+
+
+class MySQLSeatRepository(MySQLRepository):
+
+    def booked(self, schedule_id):
+        """Seat numbers with a confirmed booking on the schedule."""
+        return {row[0] for row in self._fetch_all(queries.SEATS_BOOKED, (schedule_id,))}
+
+
+class MySQLUserRepository(MySQLRepository):
+
+    def create(self, name, phone, email, password, user_type, user_id=None):
+        """Create an account; `user_id` is given when copying an account created on another shard."""
+        try:
+            with self._transaction() as connection:
+                if user_id is not None:
+                    queries.execute(connection, queries.USER_ADD_WITH_ID, (user_id, name, phone, email, password, user_type))
+                    return user_id
+                return queries.execute(connection, queries.USER_ADD, (name, phone, email, password, user_type)).lastrowid
+        except IntegrityError as e:
+            if e.errno == errorcode.ER_DUP_ENTRY:
+                raise DuplicateError(str(e)) from e
+            raise
+
+    def authenticate(self, phone, password):
+        # Credentials are always checked on the primary
+        with self._connection() as connection:
+            return queries.fetch_one(connection, queries.USER_AUTHENTICATE, (phone, password))
+
+    def get(self, user_id):
+        return self._fetch_one(queries.USER_GET, (user_id,))
+
+    def delete(self, user_id):
+        with self._transaction() as connection:
+            queries.execute(connection, queries.USER_DELETE, (user_id,))
+
+
+class MySQLBookingRepository(MySQLRepository):
+
+    def create(self, user_id, schedule_id, passengers, travel_date=None):
+        """Book one seat per passenger and queue their confirmation, all in one transaction."""
+        try:
+            with self._transaction() as connection:
+                booking_ids = []
+                events = []
+                for passenger in passengers:
+                    if queries.fetch_one(connection, queries.SEAT_TAKEN, (schedule_id, passenger.seat_no))[0] > 0:
+                        raise SeatUnavailableError(f'Seat {passenger.seat_no} already booked')
+                    queries.execute(connection, queries.SCHEDULE_TAKE_SEAT, (schedule_id,))
+                    cursor = queries.execute(connection, queries.BOOKING_ADD, (
+                        user_id, schedule_id, passenger.seat_no, passenger.name, passenger.cid,
+                        passenger.phone, travel_date or None))
+                    booking_ids.append(cursor.lastrowid)
+                    events.append(('BookingCreated', cursor.lastrowid, schedule_id, user_id, 'Confirmed', None,
+                                   json.dumps(created_payload(passenger, travel_date))))
+                # E-tickets and confirmations are sent by the job workers once this commits
+                if booking_ids:
+                    cursor = connection.cursor()
+                    enqueue_job(cursor, 'booking_confirmation', {'booking_ids': booking_ids})
+                    cursor.close()
+                    self._add_events(connection, events)
+                return booking_ids
+        except IntegrityError as e:
+            if e.errno != errorcode.ER_DUP_ENTRY:
+                raise
+            if 'passenger_cid' in str(e):
+                raise DuplicateError(str(e)) from e
+            raise SeatUnavailableError(str(e)) from e
+
+    def get(self, booking_id):
+        return self._fetch_one(queries.BOOKING_GET, (booking_id,))
+
+    def cids_taken(self, cids):
+        """Which of `cids` already have a booking here; read on the primary."""
+        with self._connection() as connection:
+            return [cid for cid in cids if queries.fetch_one(connection, queries.BOOKING_CID_TAKEN, (cid,))[0]]
+
+    @contextmanager
+    def lock_cids(self, cids):
+        """Hold a lock row per passenger CID until the block exits, in CID order to avoid deadlocks."""
+        with self._transaction() as connection:
+            for cid in sorted(set(cids)):
+                queries.execute(connection, queries.CID_LOCK, (cid,))
+            yield
+
+    @staticmethod
+    def _add_events(connection, events):
+        """Write outbox rows as the transaction's last step, under the event lock held until commit."""
+        queries.fetch_one(connection, queries.EVENT_LOCK)
+        for event in events:
+            queries.execute(connection, queries.EVENT_ADD, event)
+
+    def _set_status(self, booking_id, status):
+        with self._transaction() as connection:
+            booking = queries.fetch_one(connection, queries.BOOKING_LOCK, (booking_id,))
+            if booking is None or booking.status == status:
+                return booking
+            queries.execute(connection, queries.BOOKING_SET_STATUS, (status, booking_id))
+            # The seat map for this schedule has changed
+            queries.execute(connection, queries.SCHEDULE_BUMP_VERSION, (booking.schedule_id,))
+            self._add_events(connection, [(
+                STATUS_EVENTS[status], booking_id, booking.schedule_id, booking.user_id, status, booking.status,
+                json.dumps({'seat_no': booking.seat_no}))])
+        return booking
+
+    def cancel(self, booking_id):
+        """Cancel a booking; returns it as it was before, or None if it does not exist."""
+        return self._set_status(booking_id, 'Cancelled')
+
+    def confirm(self, booking_id):
+        """Confirm a pending booking; returns it as it was before, or None if it does not exist."""
+        return self._set_status(booking_id, 'Confirmed')
+
+    def for_user(self, user_id):
+        """All of a user's bookings, including archived trips, newest first."""
+        return self._fetch_all(queries.BOOKING_FOR_USER, (user_id,))
+
+    def search(self, search_query='', status='', limit=50):
+        """Newest bookings matching passenger, booking account or bus; searches include archived trips."""
+        params = []
+        if search_query:
+            params.extend([f'%{search_query}%', f'%{search_query}%', f'%{search_query}%'])
+        if status:
+            params.append(status)
+        params.append(limit)
+        return self._fetch_all(queries.BOOKING_SEARCH[bool(search_query), bool(status)], params)
+
+    def stats(self):
+        """Booking counts and revenue across hot and archived bookings."""
+        with self._connection(read=True) as connection:
+            hot = queries.fetch_one(connection, queries.BOOKING_STATS)
+            # Running totals for bookings already moved to the archive
+            archived = queries.fetch_one(connection, queries.ARCHIVE_SUMMARY) or (0, 0, 0, 0)
+        return {
+            'total_bookings': int(hot[0]) + int(archived[0]),
+            'confirmed_bookings': int(hot[1]) + int(archived[1]),
+            'cancelled_bookings': int(hot[2]) + int(archived[2]),
+            'revenue': hot[3] + archived[3],
+        }
+
+
+class MySQLEventRepository(MySQLRepository):
+    """The booking event outbox and consumer offsets; always read on the primary."""
+
+    def read(self, after_event_id=0, limit=100):
+        """Up to `limit` committed events after `after_event_id`, oldest first."""
+        with self._connection() as connection:
+            events = queries.fetch_all(connection, queries.EVENT_READ, (after_event_id, limit))
+        return [event.replace(payload=json.loads(event.payload))
+                if isinstance(event.payload, (str, bytes, bytearray)) else event for event in events]
+
+    def get_offset(self, consumer):
+        with self._connection() as connection:
+            row = queries.fetch_one(connection, queries.OFFSET_GET, (consumer,))
+        return row[0] if row else 0
+
+    def commit_offset(self, consumer, event_id):
+        """Record that `consumer` has processed everything up to `event_id`; offsets never move back."""
+        with self._transaction() as connection:
+            queries.execute(connection, queries.OFFSET_COMMIT, (consumer, event_id))
+
+
+class MySQLStore:
+    """All repositories backed by MySQL.
+
+    `connect` opens connections for writes and `read_connection` for
+    read-only queries; the app passes one that honours the current user's
+    read-your-writes pin. Shards pass functions connecting to their node.
+    """
+
+    def __init__(self, read_connection=None, connect=None):
+        self.connect = connect or create_connection
+        self.read_connection = read_connection or create_read_connection
+        self.routes = MySQLRouteRepository(self)
+        self.schedules = MySQLScheduleRepository(self)
+        self.seats = MySQLSeatRepository(self)
+        self.users = MySQLUserRepository(self)
+        self.bookings = MySQLBookingRepository(self)
+        self.events = MySQLEventRepository(self)
@@ -0,0 +1,254 @@
+"""Every statement the MySQL backend runs, executed as cached server-side prepared statements.
+
+Statements are registered once at import. The first time a pooled
+connection runs one, it is prepared on the server; later runs on the same
+connection reuse the statement handle and only send the parameters in the
+binary protocol, so the server skips parsing and the client skips escaping.
+Results are mapped straight into the statement's record type.
+
+The cache lives as long as the physical connection behind the pool, which
+is why the pools do not reset sessions when connections are returned.
+"""
+import threading
+import weakref
+
+from repositories.records import Booking, BookingEvent, Route, Schedule, User
+
+
+class Query:
+    """A registered statement and the record type its rows map to (None for plain tuples)."""
+
+    __slots__ = ('name', 'sql', 'record')
+
+    def __init__(self, name, sql, record=None):
+        self.name = name
+        self.sql = sql
+        self.record = record
+
+    def __repr__(self):
+        return f"Query({self.name!r})"
+
+
+STATEMENTS = {}
+
+
+def register(name, sql, record=None):
+    if name in STATEMENTS:
+        raise ValueError(f"Statement {name!r} is already registered")
+    query = STATEMENTS[name] = Query(name, sql, record)
+    return query
+
+
+# ---------------- Statement cache -----------------
+_caches = weakref.WeakKeyDictionary()   # physical connection -> {'connection_id', 'cursors'}
+_caches_lock = threading.Lock()
+
+
+def _physical(connection):
+    # Pooled handles are new on every borrow; the connection behind them is not. mysql-connector keeps it
+    # in the private `_cnx` (pinned by a test); no fallback, so a rename fails loudly instead of caching per handle
+    if getattr(connection, 'pool_name', None):
+        return connection._cnx
+    return connection
+
+
+def prepared_cursor(connection, query):
+    """The connection's prepared cursor for `query`, created on first use."""
+    cnx = _physical(connection)
+    with _caches_lock:
+        cache = _caches.get(cnx)
+        if cache is None or cache['connection_id'] != cnx.connection_id:
+            # New connection, or the pool reconnected it and the server forgot its statements
+            cache = _caches[cnx] = {'connection_id': cnx.connection_id, 'cursors': {}}
+    cursor = cache['cursors'].get(query.name)
+    if cursor is None:
+        cursor = cache['cursors'][query.name] = cnx.cursor(prepared=True)
+    return cursor
+
+
+def cached_statements(connection):
+    """Names of the statements already prepared on this connection."""
+    with _caches_lock:
+        cache = _caches.get(_physical(connection))
+    return sorted(cache['cursors']) if cache else []
+
+
+def execute(connection, query, params=()):
+    """Run a registered statement and return its cursor, e.g. for `lastrowid`."""
+    cursor = prepared_cursor(connection, query)
+    # The cursor only re-prepares when handed a different SQL string object
+    cursor.execute(query.sql, params)
+    return cursor
+
+
+def fetch_all(connection, query, params=()):
+    rows = execute(connection, query, params).fetchall()
+    if query.record is None:
+        return rows
+    return list(map(query.record.from_row, rows))
+
+
+def fetch_one(connection, query, params=()):
+    # Read the whole result so the cursor is free for its next execution
+    rows = fetch_all(connection, query, params)
+    return rows[0] if rows else None
+
+
+# ---------------- Statements -----------------
+SCHEDULE_COLUMNS = """s.schedule_id, s.bus_no, s.route_id, o.company_name, r.start, r.destination,
+                      s.reporting_time, s.travel_time, s.available_seats, b.capacity, s.ticket_price,
+                      s.version, s.updated_at"""
+SCHEDULE_JOINS = """FROM Schedule s
+                    JOIN Bus b ON s.bus_no = b.bus_no
+                    JOIN Operator o ON b.operator_id = o.operator_id
+                    JOIN Route r ON s.route_id = r.route_id"""
+
+BOOKING_COLUMNS = """b.booking_id, b.user_id, b.schedule_id, b.seat_no, b.passenger_name, b.passenger_cid,
+                     b.phone, b.status, b.booked_at, b.travel_date, s.bus_no, r.start, r.destination,
+                     s.ticket_price, s.reporting_time, s.travel_time, ua.user_type, ua.name"""
+BOOKING_JOINS = """JOIN Schedule s ON b.schedule_id = s.schedule_id
+                   JOIN Route r ON s.route_id = r.route_id
+                   LEFT JOIN UserAccount ua ON b.user_id = ua.user_id"""
+
+ROUTE_STARTS = register('route_starts', "SELECT DISTINCT start FROM Route")
+ROUTE_DESTINATIONS = register('route_destinations', "SELECT DISTINCT destination FROM Route")
+ROUTE_GET = register('route_get', "SELECT route_id, start, destination, distance FROM Route WHERE route_id = %s", Route)
+ROUTE_ADD = register('route_add', "INSERT INTO Route (start, destination, distance) VALUES (%s, %s, %s)")
+
+SCHEDULE_SEARCH = register('schedule_search', f"""
+    SELECT {SCHEDULE_COLUMNS}
+    {SCHEDULE_JOINS}
+    WHERE r.start = %s AND r.destination = %s
+    ORDER BY s.travel_time
+""", Schedule)
+SCHEDULE_GET = register('schedule_get', f"SELECT {SCHEDULE_COLUMNS} {SCHEDULE_JOINS} WHERE s.schedule_id = %s", Schedule)
+SCHEDULE_BY_BUS = register('schedule_by_bus', f"""
+    SELECT {SCHEDULE_COLUMNS} {SCHEDULE_JOINS}
+    WHERE s.bus_no = %s
+    ORDER BY s.schedule_id
+    LIMIT 1
+""", Schedule)
+SCHEDULE_LIST = register('schedule_list', f"SELECT {SCHEDULE_COLUMNS} {SCHEDULE_JOINS} ORDER BY s.bus_no", Schedule)
+SCHEDULE_TOTAL_SEATS = register('schedule_total_seats', "SELECT SUM(available_seats) FROM Schedule")
+SCHEDULE_UPDATE_TIMES = register('schedule_update_times', """
+    UPDATE Schedule
+    SET travel_time = %s, reporting_time = %s, version = version + 1
+    WHERE schedule_id = %s
+""")
+SCHEDULE_TAKE_SEAT = register('schedule_take_seat', """
+    UPDATE Schedule SET available_seats = available_seats - 1, version = version + 1 WHERE schedule_id = %s
+""")
+SCHEDULE_BUMP_VERSION = register('schedule_bump_version',
+                                 "UPDATE Schedule SET version = version + 1 WHERE schedule_id = %s")
+SCHEDULE_ADD = register('schedule_add', """
+    INSERT INTO Schedule (bus_no, route_id, reporting_time, travel_time, available_seats, ticket_price)
+    VALUES (%s, %s, %s, %s, %s, %s)
+""")
+OPERATOR_ADD = register('operator_add', "INSERT INTO Operator (company_name) VALUES (%s)")
+BUS_ADD = register('bus_add', "INSERT INTO Bus (bus_no, operator_id, capacity) VALUES (%s, %s, %s)")
+
+SEATS_BOOKED = register('seats_booked', "SELECT seat_no FROM Booking WHERE schedule_id = %s AND status = 'Confirmed'")
+SEAT_TAKEN = register('seat_taken',
+                      "SELECT COUNT(*) FROM Booking WHERE schedule_id = %s AND seat_no = %s AND status = 'Confirmed'")
+
+USER_ADD = register('user_add', """
+    INSERT INTO UserAccount (name, phone, email, password, user_type)
+    VALUES (%s, %s, %s, %s, %s)
+""")
+USER_ADD_WITH_ID = register('user_add_with_id', """
+    INSERT INTO UserAccount (user_id, name, phone, email, password, user_type)
+    VALUES (%s, %s, %s, %s, %s, %s)
+""")
+USER_AUTHENTICATE = register('user_authenticate', """
+    SELECT user_id, name, phone, email, user_type FROM UserAccount WHERE phone = %s AND password = %s
+""", User)
+USER_GET = register('user_get', "SELECT user_id, name, phone, email, user_type FROM UserAccount WHERE user_id = %s", User)
+USER_DELETE = register('user_delete', "DELETE FROM UserAccount WHERE user_id = %s")
+
+BOOKING_ADD = register('booking_add', """
+    INSERT INTO Booking (user_id, schedule_id, seat_no, seats_booked, passenger_name,
+                         passenger_cid, phone, status, travel_date)
+    VALUES (%s, %s, %s, 1, %s, %s, %s, 'Confirmed', %s)
+""")
+BOOKING_GET = register('booking_get', f"SELECT {BOOKING_COLUMNS} FROM Booking b {BOOKING_JOINS} WHERE b.booking_id = %s",
+                       Booking)
+BOOKING_LOCK = register('booking_lock',
+                        f"SELECT {BOOKING_COLUMNS} FROM Booking b {BOOKING_JOINS} WHERE b.booking_id = %s FOR UPDATE",
+                        Booking)
+BOOKING_SET_STATUS = register('booking_set_status', "UPDATE Booking SET status = %s WHERE booking_id = %s")
+BOOKING_CID_TAKEN = register('booking_cid_taken', "SELECT COUNT(*) FROM Booking WHERE passenger_cid = %s")
+# Region shards only: one lock row per passenger CID on the first node (see sharding.sql)
+CID_LOCK = register('cid_lock', """
+    INSERT INTO PassengerCidLock (passenger_cid) VALUES (%s)
+    ON DUPLICATE KEY UPDATE passenger_cid = passenger_cid
+""")
+BOOKING_LOCK_SCHEDULE = register('booking_lock_schedule',
+                                 "SELECT booking_id FROM Booking WHERE schedule_id = %s FOR UPDATE")
+BOOKING_RESCHEDULE = register('booking_reschedule', """
+    UPDATE Booking
+    SET status = 'Rescheduled'
+    WHERE schedule_id = %s AND status <> 'Cancelled'
+""")
+BOOKING_FOR_USER = register('booking_for_user', f"""
+    SELECT {BOOKING_COLUMNS}
+    FROM BookingHistory b
+    {BOOKING_JOINS}
+    WHERE b.user_id = %s
+    ORDER BY b.booked_at DESC
+""", Booking)
+BOOKING_STATS = register('booking_stats', """
+    SELECT COUNT(*),
+           COALESCE(SUM(b.status = 'Confirmed'), 0),
+           COALESCE(SUM(b.status = 'Cancelled'), 0),
+           COALESCE(SUM(CASE WHEN b.status = 'Confirmed' THEN s.ticket_price END), 0)
+    FROM Booking b
+    JOIN Schedule s ON b.schedule_id = s.schedule_id
+""")
+ARCHIVE_SUMMARY = register('archive_summary', """
+    SELECT total_bookings, confirmed_bookings, cancelled_bookings, revenue
+    FROM BookingArchiveSummary WHERE summary_id = 1
+""")
+
+
+def _booking_search(by_text, by_status):
+    # Searches include archived trips; the default view only needs hot rows
+    query = f"SELECT {BOOKING_COLUMNS} FROM {'BookingHistory' if by_text else 'Booking'} b {BOOKING_JOINS} WHERE 1=1"
+    if by_text:
+        query += " AND (b.passenger_name LIKE %s OR ua.name LIKE %s OR s.bus_no LIKE %s)"
+    if by_status:
+        query += " AND b.status = %s"
+    query += " ORDER BY b.booking_id DESC LIMIT %s"
+    return register(f"booking_search{'_text' if by_text else ''}{'_status' if by_status else ''}", query, Booking)
+
+
+# One statement per combination of filters, keyed by (by_text, by_status)
+BOOKING_SEARCH = {(by_text, by_status): _booking_search(by_text, by_status)
+                  for by_text in (False, True) for by_status in (False, True)}
+
+EVENT_COLUMNS = "event_id, event_type, booking_id, schedule_id, user_id, status, previous_status, payload, created_at"
+# Writers take this lock right before their event inserts and keep it until commit, so ids are
+# allocated in commit order and readers can follow event_id without skipping a slower transaction's
+EVENT_LOCK = register('event_lock', "SELECT lock_id FROM BookingEventLock WHERE lock_id = 1 FOR UPDATE")
+EVENT_ADD = register('event_add', """
+    INSERT INTO BookingEvent (event_type, booking_id, schedule_id, user_id, status, previous_status, payload)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+""")
+EVENT_RESCHEDULE = register('event_reschedule', """
+    INSERT INTO BookingEvent (event_type, booking_id, schedule_id, user_id, status, previous_status, payload)
+    SELECT 'BookingRescheduled', booking_id, schedule_id, user_id, 'Rescheduled', status,
+           JSON_OBJECT('seat_no', seat_no, 'travel_time', %s, 'reporting_time', %s)
+    FROM Booking
+    WHERE schedule_id = %s AND status <> 'Cancelled'
+""")
+EVENT_READ = register('event_read', f"""
+    SELECT {EVENT_COLUMNS}
+    FROM BookingEvent
+    WHERE event_id > %s
+    ORDER BY event_id
+    LIMIT %s
+""", BookingEvent)
+OFFSET_GET = register('offset_get', "SELECT last_event_id FROM ConsumerOffset WHERE consumer = %s")
+OFFSET_COMMIT = register('offset_commit', """
+    INSERT INTO ConsumerOffset (consumer, last_event_id) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE last_event_id = GREATEST(last_event_id, VALUES(last_event_id))
+""")
@@ -0,0 +1,112 @@
+"""Typed, read-only records returned by the repositories."""
+
+def _field(position):
+    return property(lambda record: record._values[position])
+
+
+def _row_mapper(cls):
+    """Build `cls.from_row`: keep the row itself, fields are read from it on access."""
+    new = object.__new__
+    size = len(cls.fields)
+
+    def from_row(row):
+        if len(row) != size:
+            raise ValueError(f"{cls.__name__} rows have {size} values, got {len(row)}")
+        record = new(cls)
+        record._values = row
+        return record
+    return from_row
+
+
+class _RecordType(type):
+    """Gives every record class read-only field properties and a from_row mapper."""
+
+    def __new__(mcs, name, bases, namespace):
+        namespace.setdefault('__slots__', ())
+        cls = super().__new__(mcs, name, bases, namespace)
+        for position, field in enumerate(cls.fields):
+            setattr(cls, field, _field(position))
+        cls.from_row = staticmethod(_row_mapper(cls))
+        return cls
+
+
+class Record(metaclass=_RecordType):
+    """Lightweight, immutable row type backed by the result row itself.
+
+    Subclasses list their `fields` in column order and get a `from_row(row)`
+    static method that wraps a result row with exactly one value per field,
+    without copying it.
+    """
+
+    __slots__ = ('_values',)
+    fields = ()
+
+    def __init__(self, *values, **fields):
+        if len(values) > len(self.fields):
+            raise TypeError(f"{type(self).__name__} takes at most {len(self.fields)} values")
+        missing = [fields.pop(name, None) for name in self.fields[len(values):]]
+        if fields:
+            raise TypeError(f"Unknown {type(self).__name__} fields: {', '.join(fields)}")
+        self._values = values + tuple(missing)
+
+    def replace(self, **changes):
+        """Copy of the record with some fields changed."""
+        values = self.as_dict()
+        values.update(changes)
+        return type(self)(**values)
+
+    def as_dict(self):
+        return dict(zip(self.fields, self._values))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple(self._values) == tuple(other._values)
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={value!r}" for name, value in zip(self.fields, self._values))
+        return f"{type(self).__name__}({fields})"
+
+
+class Route(Record):
+    fields = ('route_id', 'start', 'destination', 'distance')
+
+
+class Schedule(Record):
+    """A timetabled bus on a route, joined with its bus, operator and route.
+
+    `version` goes up whenever anything shown for the schedule changes.
+    """
+    fields = ('schedule_id', 'bus_no', 'route_id', 'operator_name', 'start', 'destination',
+                 'reporting_time', 'travel_time', 'available_seats', 'capacity', 'ticket_price',
+                 'version', 'updated_at')
+
+
+class User(Record):
+    fields = ('user_id', 'name', 'phone', 'email', 'user_type')
+
+
+class Booking(Record):
+    """A booked seat, joined with its schedule, route and the account that booked it."""
+    fields = ('booking_id', 'user_id', 'schedule_id', 'seat_no', 'passenger_name', 'passenger_cid',
+                 'phone', 'status', 'booked_at', 'travel_date', 'bus_no', 'start', 'destination',
+                 'ticket_price', 'reporting_time', 'travel_time', 'user_type', 'booked_by')
+
+
+class BookingEvent(Record):
+    """One committed change to a booking, as written to the outbox."""
+    fields = ('event_id', 'event_type', 'booking_id', 'schedule_id', 'user_id', 'status', 'previous_status',
+                 'payload', 'created_at')
+
+
+# Event written when a booking moves to a status
+STATUS_EVENTS = {'Confirmed': 'BookingConfirmed', 'Cancelled': 'BookingCancelled', 'Rescheduled': 'BookingRescheduled'}
+
+
+def created_payload(passenger, travel_date):
+    """BookingCreated event payload for one passenger's seat."""
+    return {'seat_no': passenger.seat_no, 'passenger_name': passenger.name, 'passenger_cid': passenger.cid,
+            'phone': passenger.phone, 'travel_date': str(travel_date) if travel_date else None}
+
+
+class Passenger(Record):
+    """One seat's passenger details when creating bookings."""
+    fields = ('seat_no', 'name', 'cid', 'phone')
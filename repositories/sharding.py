@@ -0,0 +1,230 @@
+"""Region shards: each route, its schedules and their bookings live on the node for the route's region.
+
+Trips never cross regions, so everything about one trip is on one shard and
+booking transactions stay local. Views that span trips (a passenger's
+bookings, the counter dashboard) are scatter-gathered from every shard.
+
+Passenger CIDs are unique across all shards: a booking takes the CIDs'
+lock rows on the first shard, checks every shard, then books on its own.
+
+Accounts are created on the first shard and copied to the others with the
+same user_id, so bookings keep their foreign key and account joins. Buses and
+operators are reference data and are copied to every shard as well.
+
+Shard node k (0-based) of N runs with auto_increment_increment = N and
+auto_increment_offset = k + 1 (see sharding.sql), so ids are globally unique
+and the shard holding a route, schedule or booking is `(id - 1) % N`.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import chain
+
+from db_config import SHARDS, create_connection
+from repositories.errors import DuplicateError
+from repositories.mysql_backend import MySQLStore
+
+REGIONS = {
+    'western': ('Thimphu', 'Paro', 'Phuentsholing', 'Haa', 'Punakha', 'Chukha', 'Samtse', 'Wangdue Phodrang'),
+    'central': ('Trongsa', 'Bumthang', 'Zhemgang', 'Sarpang', 'Gelephu', 'Tsirang', 'Dagana'),
+    'eastern': ('Mongar', 'Trashigang', 'Samdrup Jongkhar', 'Trashiyangtse', 'Lhuentse', 'Pemagatshel'),
+}
+DEFAULT_REGION = 'western'   # for locations not yet assigned a region
+
+
+class ShardRouter:
+    """Maps locations and row ids to shard positions."""
+
+    def __init__(self, region_shards, shard_count=None):
+        self.region_shards = dict(region_shards)
+        self.shard_count = shard_count or len(set(self.region_shards.values()))
+        self.location_regions = {location: region for region, locations in REGIONS.items() for location in locations}
+
+    def region_of(self, location):
+        return self.location_regions.get(location, DEFAULT_REGION)
+
+    def shard_for_location(self, location):
+        """Shard of the routes starting at `location`."""
+        return self.region_shards[self.region_of(location)]
+
+    def shard_for_id(self, row_id):
+        """Shard that allocated a route, schedule or booking id."""
+        return (int(row_id) - 1) % self.shard_count
+
+
+class ShardedRepository:
+
+    def __init__(self, store):
+        self.store = store
+
+
+class ShardedRouteRepository(ShardedRepository):
+
+    def start_locations(self):
+        return list(dict.fromkeys(chain.from_iterable(self.store.gather(lambda shard: shard.routes.start_locations()))))
+
+    def destinations(self):
+        return list(dict.fromkeys(chain.from_iterable(self.store.gather(lambda shard: shard.routes.destinations()))))
+
+    def get(self, route_id):
+        return self.store.for_id(route_id).routes.get(route_id)
+
+    def add(self, start, destination, distance):
+        return self.store.for_location(start).routes.add(start, destination, distance)
+
+
+class ShardedScheduleRepository(ShardedRepository):
+
+    def search(self, start, destination):
+        return self.store.for_location(start).schedules.search(start, destination)
+
+    def get(self, schedule_id):
+        return self.store.for_id(schedule_id).schedules.get(schedule_id)
+
+    def get_by_bus(self, bus_no):
+        found = [schedule for schedule in self.store.gather(lambda shard: shard.schedules.get_by_bus(bus_no)) if schedule]
+        return min(found, key=lambda schedule: schedule.schedule_id) if found else None
+
+    def list_all(self):
+        schedules = chain.from_iterable(self.store.gather(lambda shard: shard.schedules.list_all()))
+        return sorted(schedules, key=lambda schedule: schedule.bus_no)
+
+    def total_available_seats(self):
+        return sum(self.store.gather(lambda shard: shard.schedules.total_available_seats()))
+
+    def update_times(self, schedule_id, travel_time, reporting_time):
+        self.store.for_id(schedule_id).schedules.update_times(schedule_id, travel_time, reporting_time)
+
+    def add_bus(self, bus_no, operator_name, capacity):
+        for shard in self.store.shards:
+            shard.schedules.add_bus(bus_no, operator_name, capacity)
+
+    def add(self, bus_no, route_id, reporting_time, travel_time, available_seats, ticket_price):
+        return self.store.for_id(route_id).schedules.add(bus_no, route_id, reporting_time, travel_time,
+                                                         available_seats, ticket_price)
+
+
+class ShardedSeatRepository(ShardedRepository):
+
+    def booked(self, schedule_id):
+        return self.store.for_id(schedule_id).seats.booked(schedule_id)
+
+
+class ShardedUserRepository(ShardedRepository):
+
+    def create(self, name, phone, email, password, user_type):
+        """Create the account on the first shard, which enforces uniqueness, then copy it to the rest.
+
+        If any copy fails the account is removed from every shard again, so
+        registering can simply be retried.
+        """
+        user_id = self.store.shards[0].users.create(name, phone, email, password, user_type)
+        created = [self.store.shards[0]]
+        try:
+            for shard in self.store.shards[1:]:
+                shard.users.create(name, phone, email, password, user_type, user_id=user_id)
+                created.append(shard)
+        except Exception:
+            for shard in reversed(created):
+                try:
+                    shard.users.delete(user_id)
+                except Exception as e:
+                    print(f"Error removing partial account {user_id}: {e}")
+            raise
+        return user_id
+
+    def authenticate(self, phone, password):
+        return self.store.shards[0].users.authenticate(phone, password)
+
+    def get(self, user_id):
+        return self.store.shards[0].users.get(user_id)
+
+    def delete(self, user_id):
+        for shard in self.store.shards:
+            shard.users.delete(user_id)
+
+
+def _newest_first(bookings):
+    # Ids from different shards interleave, so order by booking time across shards
+    return sorted(bookings, key=lambda booking: (booking.booked_at, booking.booking_id), reverse=True)
+
+
+class ShardedBookingRepository(ShardedRepository):
+
+    def create(self, user_id, schedule_id, passengers, travel_date=None):
+        """Book on the trip's shard while holding the passengers' CID locks, so a CID is booked on one shard only."""
+        cids = [passenger.cid for passenger in passengers]
+        with self.store.shards[0].bookings.lock_cids(cids):
+            taken = list(chain.from_iterable(self.store.gather(lambda shard: shard.bookings.cids_taken(cids))))
+            if taken:
+                raise DuplicateError(f'Duplicate passenger CID {taken[0]}')
+            return self.store.for_id(schedule_id).bookings.create(user_id, schedule_id, passengers, travel_date)
+
+    def get(self, booking_id):
+        return self.store.for_id(booking_id).bookings.get(booking_id)
+
+    def cancel(self, booking_id):
+        return self.store.for_id(booking_id).bookings.cancel(booking_id)
+
+    def confirm(self, booking_id):
+        return self.store.for_id(booking_id).bookings.confirm(booking_id)
+
+    def for_user(self, user_id):
+        return _newest_first(chain.from_iterable(self.store.gather(lambda shard: shard.bookings.for_user(user_id))))
+
+    def search(self, search_query='', status='', limit=50):
+        results = self.store.gather(lambda shard: shard.bookings.search(search_query, status, limit))
+        return _newest_first(chain.from_iterable(results))[:limit]
+
+    def stats(self):
+        totals = {}
+        for stats in self.store.gather(lambda shard: shard.bookings.stats()):
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+
+class ShardedStore:
+    """Routes every repository call to the shard that owns the trip, or gathers from all of them.
+
+    `shards` are ordinary stores (MySQLStore or InMemoryStore), one per node.
+    Without a router, regions are spread over the shards in REGIONS order.
+    """
+
+    def __init__(self, shards, router=None):
+        self.shards = list(shards)
+        self.router = router or ShardRouter({region: position % len(self.shards)
+                                             for position, region in enumerate(REGIONS)}, len(self.shards))
+        self.executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix='shard')
+        self.routes = ShardedRouteRepository(self)
+        self.schedules = ShardedScheduleRepository(self)
+        self.seats = ShardedSeatRepository(self)
+        self.users = ShardedUserRepository(self)
+        self.bookings = ShardedBookingRepository(self)
+
+    def for_location(self, location):
+        return self.shards[self.router.shard_for_location(location)]
+
+    def for_id(self, row_id):
+        return self.shards[self.router.shard_for_id(row_id)]
+
+    def gather(self, call):
+        """Run `call(shard)` on every shard at once; results come back in shard order."""
+        return list(self.executor.map(call, self.shards))
+
+
+def configured_router(shards=None):
+    """(nodes, router) for shards configured as {region: "host:port"}, by default db_config.SHARDS."""
+    shards = shards or SHARDS
+    missing = set(REGIONS) - set(shards)
+    if missing:
+        raise ValueError(f"No shard configured for regions: {', '.join(sorted(missing))}")
+    nodes = list(dict.fromkeys(shards.values()))
+    return nodes, ShardRouter({region: nodes.index(node) for region, node in shards.items()}, len(nodes))
+
+
+def mysql_sharded_store(shards=None):
+    """ShardedStore over the configured MySQL nodes."""
+    nodes, router = configured_router(shards)
+    stores = [MySQLStore(read_connection=partial(create_connection, node), connect=partial(create_connection, node))
+              for node in nodes]
+    return ShardedStore(stores, router)
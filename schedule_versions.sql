@@ -0,0 +1,9 @@
+USE DrRide_db;
+
+/* ================= Schedule versions for HTTP caching =================
+   version goes up with every booking, cancellation, reschedule or fare
+   change on the schedule. Search results and seat maps use it as their
+   ETag, and updated_at as their Last-Modified. */
+ALTER TABLE Schedule
+ADD COLUMN version INT NOT NULL DEFAULT 0,
+ADD COLUMN updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP;
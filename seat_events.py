@@ -0,0 +1,191 @@
+"""Live seat availability: in-process pub/sub, seat holds and Server-Sent Events.
+
+Every booking, cancellation and hold change is published as a delta on the
+schedule's channel. Subscribers keep no queue of their own; they remember
+the last version they saw and read newer deltas from the channel's ring
+buffer, so an idle viewer costs one blocked greenlet and a few bytes.
+
+Holds and channels live in this process's memory, so the app must run as
+a single worker process: with several, two passengers could hold the same
+seat and each viewer would only see its own worker's deltas. gunicorn.conf.py
+runs one gevent worker, so blocked subscribers are greenlets rather than
+threads (``gunicorn app:app``). Scaling out needs the holds and deltas in a
+shared store first.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+HISTORY_SIZE = 256      # deltas kept per schedule for subscribers to catch up from
+KEEPALIVE = 15.0        # seconds between heartbeat comments on idle streams
+HOLD_TTL = 300          # seconds a seat stays held while the passenger fills in details
+SWEEP_INTERVAL = 5.0    # seconds between sweeps publishing holds that expired on quiet schedules
+RETRY_MS = 3000         # browser reconnect delay after a dropped stream
+
+
+class SeatChannel:
+    """Versioned stream of seat deltas for one schedule."""
+
+    def __init__(self):
+        self.version = 0
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.condition = threading.Condition()
+
+    def publish(self, delta):
+        with self.condition:
+            self.version += 1
+            self.history.append((self.version, delta))
+            self.condition.notify_all()
+            return self.version
+
+    def changes_since(self, version, timeout=KEEPALIVE):
+        """Wait up to `timeout` for deltas newer than `version`.
+
+        Returns (latest_version, deltas); deltas is None when the caller has
+        fallen further behind than the ring buffer and must reload.
+        """
+        with self.condition:
+            if self.version <= version:
+                self.condition.wait(timeout)
+            if self.version <= version:
+                return self.version, []
+            if not self.history or self.history[0][0] > version + 1:
+                return self.version, None
+            return self.version, [(v, delta) for v, delta in self.history if v > version]
+
+
+_channels = {}
+_channels_lock = threading.Lock()
+_holds = {}             # schedule_id -> {seat_no: (holder, expires_at)}
+_holds_lock = threading.Lock()
+_sweeper = None
+
+
+def get_channel(schedule_id):
+    with _channels_lock:
+        channel = _channels.get(schedule_id)
+        if channel is None:
+            channel = _channels[schedule_id] = SeatChannel()
+        return channel
+
+
+def publish_seats(schedule_id, seats, status):
+    """Tell everyone viewing `schedule_id` that `seats` are now `status`."""
+    if not seats:
+        return None
+    return get_channel(schedule_id).publish({'seats': sorted(int(seat) for seat in seats), 'status': status})
+
+
+def publish_resync(schedule_id):
+    """Tell viewers to reload the whole seat map, e.g. after a reschedule."""
+    return get_channel(schedule_id).publish({'resync': True})
+
+
+# ---------------- Seat holds -----------------
+def _expire_holds(schedule_id, now):
+    held = _holds.get(schedule_id, {})
+    expired = [seat for seat, (_, expires_at) in held.items() if expires_at <= now]
+    for seat in expired:
+        del held[seat]
+    return expired
+
+
+def sweep_expired_holds(now=None):
+    """Drop expired holds on every schedule and publish their seats as available."""
+    now = time.time() if now is None else now
+    with _holds_lock:
+        expired = {schedule_id: _expire_holds(schedule_id, now) for schedule_id in list(_holds)}
+        for schedule_id in [schedule_id for schedule_id, held in _holds.items() if not held]:
+            del _holds[schedule_id]
+    for schedule_id, seats in expired.items():
+        publish_seats(schedule_id, seats, 'available')
+    return expired
+
+
+def _sweep_forever(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            sweep_expired_holds()
+        except Exception as e:
+            print(f"Error sweeping seat holds: {e}")
+
+
+def start_sweeper(interval=SWEEP_INTERVAL):
+    """Start the background sweeper once per process; holds otherwise expire only when a schedule is read."""
+    global _sweeper
+    with _holds_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_forever, args=(interval,), name='hold-sweeper', daemon=True)
+            _sweeper.start()
+
+
+def hold_seats(schedule_id, seats, holder, ttl=HOLD_TTL):
+    """Hold `seats` for `holder`. Returns the seats already held by someone else."""
+    start_sweeper()
+    now = time.time()
+    with _holds_lock:
+        expired = _expire_holds(schedule_id, now)
+        held = _holds.setdefault(schedule_id, {})
+        taken = [seat for seat in seats if seat in held and held[seat][0] != holder]
+        if not taken:
+            # A passenger who changed their selection gives up their previous holds
+            dropped = [seat for seat, (owner, _) in held.items() if owner == holder and seat not in seats]
+            for seat in dropped:
+                del held[seat]
+            expired += dropped
+            for seat in seats:
+                held[seat] = (holder, now + ttl)
+    publish_seats(schedule_id, expired, 'available')
+    if not taken:
+        publish_seats(schedule_id, seats, 'held')
+    return taken
+
+
+def release_holds(schedule_id, holder):
+    """Drop every hold `holder` has on the schedule; the caller publishes the seats' new state."""
+    with _holds_lock:
+        held = _holds.get(schedule_id, {})
+        seats = [seat for seat, (owner, _) in held.items() if owner == holder]
+        for seat in seats:
+            del held[seat]
+    return seats
+
+
+def held_seats(schedule_id, exclude_holder=None):
+    """Seats currently held on the schedule, optionally ignoring one holder's own holds."""
+    now = time.time()
+    with _holds_lock:
+        expired = _expire_holds(schedule_id, now)
+        seats = {seat for seat, (owner, _) in _holds.get(schedule_id, {}).items() if owner != exclude_holder}
+    publish_seats(schedule_id, expired, 'available')
+    return seats
+
+
+# ---------------- Server-Sent Events -----------------
+def format_event(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def event_stream(schedule_id, last_event_id=None):
+    """Generate the SSE stream of seat deltas for one schedule."""
+    channel = get_channel(schedule_id)
+    version = channel.version
+    if last_event_id is not None and last_event_id.isdigit() and int(last_event_id) <= channel.version:
+        version = int(last_event_id)
+    yield f"retry: {RETRY_MS}\n\n"
+    while True:
+        latest, deltas = channel.changes_since(version)
+        if deltas is None:
+            yield format_event('resync', {}, latest)
+        elif not deltas:
+            yield ": keepalive\n\n"
+        for delta_version, delta in deltas or []:
+            yield format_event('resync' if delta.get('resync') else 'seats', delta, delta_version)
+        version = latest
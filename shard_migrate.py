@@ -0,0 +1,176 @@
+"""Split the primary's trip data across the region shard nodes.
+
+Run once when turning sharding on, after loading schema.sql and the
+migrations on every node listed in DRUKRIDE_SHARDS (see sharding.sql):
+
+    python shard_migrate.py
+
+Node k (0-based, in order of first appearance in DRUKRIDE_SHARDS) of N is
+set to auto_increment_increment = N and auto_increment_offset = k + 1, so
+every id it allocates satisfies (id - 1) % N == k. Each route is written
+to the node for its start location's region under a new id from that
+node's sequence, followed by its schedules and their hot and archived
+bookings, so every id routes back to the node holding it. The routes and
+schedules seeded by schema.sql on the nodes are replaced. Accounts,
+operators and buses are copied to every node with their ids unchanged.
+
+E-ticket codes sign the booking id, so every ticket issued before the
+migration stops verifying. Each node therefore queues a booking_confirmation
+job for its bookings that are not cancelled and have not departed; the job
+workers send those passengers a new e-ticket. Start the workers for the
+shard nodes once the migration is done.
+
+Drain the job queue and let booking event consumers catch up first:
+queued jobs and the old outbox refer to the old ids.
+"""
+import sys
+from datetime import date
+
+from db_config import DB_CONFIG, create_connection, close_connection, write_nodes
+from jobs import enqueue_job
+from repositories import configured_router
+
+SHARED_TABLES = ('Operator', 'Bus', 'UserAccount')   # copied to every node as they are
+SOURCE_TABLES = SHARED_TABLES + ('Route', 'Schedule', 'Booking', 'BookingArchive', 'BookingArchiveSummary')
+
+
+def node_settings(count):
+    """(auto_increment_increment, auto_increment_offset) for each of `count` nodes."""
+    return [(count, position + 1) for position in range(count)]
+
+
+def load_source(connection):
+    """Every row of the tables being moved, as dicts."""
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute("SELECT COUNT(*) AS pending FROM JobQueue WHERE status IN ('Queued', 'Running')")
+    if cursor.fetchone()['pending']:
+        raise ValueError('The job queue still has pending jobs; let the workers drain it first')
+    tables = {}
+    for table in SOURCE_TABLES:
+        cursor.execute(f"SELECT * FROM {table}")
+        tables[table] = cursor.fetchall()
+    cursor.close()
+    return tables
+
+
+def plan_shards(tables, router):
+    """Split the source rows per shard, renumbering routes, schedules and bookings into each shard's id sequence."""
+    count = router.shard_count
+    next_ids = [{} for _ in range(count)]
+
+    def allocate(shard, sequence):
+        next_ids[shard][sequence] = next_ids[shard].get(sequence, shard + 1 - count) + count
+        return next_ids[shard][sequence]
+
+    shards = [{table: [] for table in ('Route', 'Schedule', 'Booking', 'BookingArchive')} for _ in range(count)]
+    routes = {}
+    for row in tables['Route']:
+        shard = router.shard_for_location(row['start'])
+        routes[row['route_id']] = (shard, allocate(shard, 'route'))
+        shards[shard]['Route'].append(dict(row, route_id=routes[row['route_id']][1]))
+    schedules = {}
+    for row in tables['Schedule']:
+        shard, route_id = routes[row['route_id']]
+        schedules[row['schedule_id']] = (shard, allocate(shard, 'schedule'))
+        shards[shard]['Schedule'].append(dict(row, schedule_id=schedules[row['schedule_id']][1], route_id=route_id))
+    # Hot and archived bookings share one id space, since BookingHistory unions them
+    for table in ('Booking', 'BookingArchive'):
+        for row in tables[table]:
+            if row['schedule_id'] not in schedules:
+                raise ValueError(f"{table} {row['booking_id']} refers to missing schedule {row['schedule_id']}")
+            shard, schedule_id = schedules[row['schedule_id']]
+            shards[shard][table].append(dict(row, booking_id=allocate(shard, 'booking'), schedule_id=schedule_id))
+    return shards
+
+
+def tickets_to_reissue(bookings, today):
+    """New ids of the hot bookings whose passengers still travel and need a ticket for the new id."""
+    return [row['booking_id'] for row in bookings
+            if row['status'] != 'Cancelled' and (row['travel_date'] is None or row['travel_date'] >= today)]
+
+
+def _insert(cursor, table, rows, upsert=False):
+    for row in rows:
+        columns = ', '.join(row)
+        placeholders = ', '.join(['%s'] * len(row))
+        sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+        if upsert:
+            sql += " ON DUPLICATE KEY UPDATE " + ', '.join(f"{column} = VALUES({column})" for column in row)
+        cursor.execute(sql, list(row.values()))
+
+
+def write_node(connection, increment, offset, shared, rows, summary):
+    """Configure one node's id sequence and load its share of the data in one transaction.
+
+    Returns how many e-tickets were queued for re-issue.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM Booking")
+        if cursor.fetchone()[0]:
+            raise ValueError('Node already has bookings; shard_migrate only loads fresh nodes')
+        for scope in ('PERSIST', 'SESSION'):
+            cursor.execute(f"SET {scope} auto_increment_increment = {int(increment)}")
+            cursor.execute(f"SET {scope} auto_increment_offset = {int(offset)}")
+        # Drop the copies seeded by schema.sql; their ids belong to the primary's numbering
+        for table in ('BookingArchive', 'Schedule', 'Route'):
+            cursor.execute(f"DELETE FROM {table}")
+        for table in SHARED_TABLES:
+            _insert(cursor, table, shared[table], upsert=True)
+        for table in ('Route', 'Schedule', 'Booking', 'BookingArchive'):
+            _insert(cursor, table, rows[table])
+        cursor.execute("""
+            UPDATE BookingArchiveSummary
+            SET total_bookings = %s, confirmed_bookings = %s, cancelled_bookings = %s, revenue = %s
+            WHERE summary_id = 1
+        """, summary)
+        # One job per booking, so a failed send is retried for that passenger alone
+        reissued = tickets_to_reissue(rows['Booking'], date.today())
+        for booking_id in reissued:
+            enqueue_job(cursor, 'booking_confirmation', {'booking_ids': [booking_id]})
+        connection.commit()
+        return len(reissued)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def migrate(shards=None):
+    """Move the primary's data onto the nodes configured as {region: "host:port"}, by default db_config.SHARDS."""
+    nodes, router = configured_router(shards)
+    connection = create_connection()
+    if not connection:
+        raise ValueError(f"Could not connect to the primary at {DB_CONFIG['host']}")
+    try:
+        tables = load_source(connection)
+    finally:
+        close_connection(connection)
+
+    plan = plan_shards(tables, router)
+    # Archive totals cannot be split after the fact; they stay on the first node and stats() sums every shard
+    summary = tables['BookingArchiveSummary'][0] if tables['BookingArchiveSummary'] else {}
+    archived = tuple(summary.get(column, 0) for column in
+                     ('total_bookings', 'confirmed_bookings', 'cancelled_bookings', 'revenue'))
+    for position, (node, (increment, offset)) in enumerate(zip(nodes, node_settings(len(nodes)))):
+        connection = create_connection(node)
+        if not connection:
+            raise ValueError(f"Could not connect to shard node {node}")
+        try:
+            reissued = write_node(connection, increment, offset, tables, plan[position],
+                                  archived if position == 0 else (0,) * 4)
+        finally:
+            close_connection(connection)
+        counts = ', '.join(f"{len(rows)} {table}" for table, rows in plan[position].items())
+        print(f"Loaded node {node} (offset {offset} of {increment}): {counts}; re-issuing {reissued} e-tickets")
+
+
+if __name__ == '__main__':
+    if write_nodes() == [None]:
+        sys.exit('Set DRUKRIDE_SHARDS to the region nodes first')
+    try:
+        migrate()
+    except Exception as e:
+        print(f"Error migrating to shards: {e}")
+        sys.exit(1)
@@ -0,0 +1,29 @@
+/* ================== Region shard nodes ===================*/
+-- Each region shard is its own MySQL node, listed in DRUKRIDE_SHARDS, e.g.
+--   DRUKRIDE_SHARDS="western=10.0.1.5:3306,central=10.0.2.5:3306,eastern=10.0.3.5:3306"
+-- Regions may share a node. Node k of N (in order of first appearance in
+-- DRUKRIDE_SHARDS) allocates ids k, k+N, k+2N, ... so ids are unique across
+-- shards and the app finds the shard holding a route, schedule or booking
+-- from its id alone.
+
+-- 1. On every node, load schema.sql followed by archive_tables.sql,
+--    job_queue.sql, schedule_versions.sql and booking_events.sql.
+--
+-- 2. With DRUKRIDE_SHARDS set, run from the app host:
+--      python shard_migrate.py
+--    It sets auto_increment_increment = N and auto_increment_offset = k on
+--    each node from DRUKRIDE_SHARDS, replaces the routes and schedules seeded
+--    by schema.sql, and loads each node with only its regions' routes,
+--    schedules and bookings, renumbered into that node's ids.
+--    E-tickets sign the booking id, so it queues new e-tickets for every
+--    upcoming booking; start the job workers afterwards to send them.
+--
+-- 3. On the first node only (the first entry in DRUKRIDE_SHARDS), which
+--    also holds the accounts: bookings lock their passengers' CIDs here,
+--    then check every shard, so a CID has bookings on one shard at most.
+CREATE TABLE IF NOT EXISTS PassengerCidLock (
+    passenger_cid BIGINT UNSIGNED PRIMARY KEY
+);
+
+-- To check a node afterwards:
+SELECT @@GLOBAL.auto_increment_increment, @@GLOBAL.auto_increment_offset;